@@ -0,0 +1,9 @@
+"""
+MyPaint - Бенчмарки редактора без окна на видеодрайвере SDL dummy
+Copyright (c) 2025 Denis Korabelnikov
+
+Запуск из папки MyPaint:
+    python -m benchmarks                  # все сценарии и сравнение с эталоном
+    python -m benchmarks pencil_scribble  # отдельные сценарии
+    python -m benchmarks --update         # запись эталона на этой машине
+"""
@@ -0,0 +1,248 @@
+"""
+MyPaint - Запуск бенчмарков и сравнение с эталоном
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+COMPARED = ("p95_ms", "peak_rss_mb")  # Метрики, рост которых считается регрессией
+# Абсолютный допуск метрик в дополнение к относительному: доли миллисекунды
+# в p95 коротких кадров колеблются от запуска к запуску сильнее, чем на 25%
+FLOORS = {"p95_ms": 1.0, "peak_rss_mb": 0.0}
+
+
+def peak_rss_mb():
+    """
+    Пиковый объем резидентной памяти процесса.
+
+    Returns:
+        float: Память в МБ или None, если платформа не поддерживается
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_scenario(name):
+    """
+    Выполнение сценария в текущем процессе.
+
+    Args:
+        name (str): Название сценария
+
+    Returns:
+        dict: Метрики сценария
+    """
+    import numpy as np
+
+    from benchmarks.driver import Driver
+    from benchmarks.scenarios import SCENARIOS
+
+    func = SCENARIOS[name]
+    driver = Driver(getattr(func, "grid_size", (80, 55)))
+    try:
+        func(driver)
+    finally:
+        driver.close()
+    times = np.array(driver.frame_times) * 1000
+    p50, p95, p99 = np.percentile(times, (50, 95, 99))
+    metrics = {
+        "frames": len(times),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(times.max()), 3),
+        "events_per_s": round(driver.events / driver.elapsed, 1),
+        "seconds": round(driver.elapsed, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if driver.paint.last_export:
+        metrics["export_s"] = round(driver.paint.last_export["seconds"], 3)
+    return metrics
+
+
+def run_isolated(name):
+    """
+    Выполнение сценария в отдельном процессе, чтобы пиковая память
+    и кэши одного сценария не влияли на другие.
+
+    Args:
+        name (str): Название сценария
+
+    Returns:
+        dict: Метрики сценария
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks", "--child", name],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_repeated(name, repeat):
+    """
+    Несколько запусков сценария: каждая метрика берется как медиана
+    по запускам, чтобы один неудачный запуск не давал регрессию.
+
+    Args:
+        name (str): Название сценария
+        repeat (int): Количество запусков
+
+    Returns:
+        dict: Медианные метрики сценария
+    """
+    import numpy as np
+
+    runs = [run_isolated(name) for _ in range(repeat)]
+    metrics = {}
+    for key, value in runs[0].items():
+        values = [run.get(key) for run in runs]
+        if value is None or any(v is None for v in values):
+            metrics[key] = value
+        else:
+            metrics[key] = round(float(np.median(values)), 3)
+    metrics["frames"] = runs[0]["frames"]
+    metrics["repeat"] = repeat
+    return metrics
+
+
+def compare(results, baseline, tolerance, floor_ms):
+    """
+    Сравнение результатов с эталоном. Метрика считается регрессией,
+    если выросла больше допуска и относительно, и абсолютно.
+
+    Args:
+        results (dict): Метрики по сценариям
+        baseline (dict): Эталонные метрики по сценариям
+        tolerance (float): Допустимый относительный рост метрики
+        floor_ms (float): Допустимый абсолютный рост времени кадра в мс
+
+    Returns:
+        list: Описания регрессий
+    """
+    floors = {**FLOORS, "p95_ms": floor_ms}
+    regressions = []
+    for name, metrics in results.items():
+        for key in COMPARED:
+            old = baseline.get(name, {}).get(key)
+            new = metrics.get(key)
+            if (
+                old
+                and new is not None
+                and new > old * (1 + tolerance)
+                and new - old > floors[key]
+            ):
+                regressions.append(f"{name}: {key} {old} -> {new}")
+    return regressions
+
+
+def print_table(results, baseline):
+    """
+    Вывод таблицы результатов.
+
+    Args:
+        results (dict): Метрики по сценариям
+        baseline (dict): Эталонные метрики по сценариям
+    """
+    print(
+        f"{'scenario':<16}{'frames':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'max ms':>9}{'events/s':>10}{'RSS MB':>9}{'p95 vs base':>13}"
+    )
+    for name, m in results.items():
+        old = baseline.get(name, {}).get("p95_ms")
+        change = f"{(m['p95_ms'] / old - 1) * 100:+.0f}%" if old else "-"
+        rss = f"{m['peak_rss_mb']:.0f}" if m["peak_rss_mb"] is not None else "-"
+        print(
+            f"{name:<16}{m['frames']:>8}{m['p50_ms']:>9.2f}{m['p95_ms']:>9.2f}"
+            f"{m['p99_ms']:>9.2f}{m['max_ms']:>9.2f}{m['events_per_s']:>10.0f}"
+            f"{rss:>9}{change:>13}"
+        )
+
+
+def main():
+    """
+    Разбор аргументов командной строки и запуск сценариев.
+    Эталон зависит от машины, поэтому перед сравнением его нужно записать
+    на своей машине с флагом --update.
+
+    Returns:
+        int: Код возврата, 1 при обнаружении регрессии
+    """
+    from benchmarks.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="MyPaint headless benchmarks"
+    )
+    parser.add_argument("scenarios", nargs="*", help=", ".join(SCENARIOS))
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON file")
+    parser.add_argument(
+        "--update",
+        "--save-baseline",
+        action="store_true",
+        help="record results on this machine as the baseline",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per scenario, medians are kept"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed relative slowdown"
+    )
+    parser.add_argument(
+        "--floor-ms",
+        type=float,
+        default=FLOORS["p95_ms"],
+        help="allowed absolute p95 slowdown in ms",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child)))
+        return 0
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {name: run_repeated(name, max(args.repeat, 1)) for name in names}
+    print_table(results, baseline)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved: {args.baseline}")
+        return 0
+
+    missing = [name for name in names if name not in baseline]
+    if missing:
+        print(f"No baseline for {', '.join(missing)}, record it with --update")
+    regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        print("Baseline is machine-specific, re-record it locally with --update")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
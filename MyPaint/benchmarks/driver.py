@@ -0,0 +1,206 @@
+"""
+MyPaint - Управление редактором синтетическими событиями
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+import numpy as np  # noqa: E402
+import pygame  # noqa: E402
+
+from paint import Paint  # noqa: E402
+
+# Центры кнопок меню в координатах окна
+BUTTONS = {
+    "pencil": (28, 29),
+    "eraser": (28, 70),
+    "line": (78, 26),
+    "rectangle": (102, 26),
+    "ellipse": (126, 26),
+    "arc": (78, 50),
+    "fill": (102, 50),
+    "save_jpg": (372, 29),
+    "save_png": (372, 70),
+}
+
+
+class Driver:
+    """
+    Редактор без окна, который получает события от сценария.
+    Каждый кадр состоит из обработки событий и отрисовки, как в Paint.run,
+    но без ожидания таймера. Время кадров записывается, пока включено измерение.
+
+    Attributes:
+        paint (Paint): Управляемый редактор
+        frame_times (list): Длительность измеренных кадров в секундах
+        events (int): Количество событий в измеренных кадрах
+    """
+
+    def __init__(self, grid_size=(80, 55)):
+        os.chdir(SRC)  # Ресурсы редактора загружаются по путям относительно src
+        self.paint = Paint(grid_size)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paint.image_dir = self.tmp.name
+        self.paint.project.path = os.path.join(self.tmp.name, "drawing.mypaint")
+        self.frame_times = []
+        self.events = 0
+        self.measuring = False
+        self.started = None
+        self.elapsed = 0.0
+
+    def start(self):
+        """
+        Начало измерения: кадры подготовки сценария не учитываются.
+        """
+        self.measuring = True
+        self.started = time.perf_counter()
+
+    def stop(self):
+        """
+        Окончание измерения.
+        """
+        self.elapsed += time.perf_counter() - self.started
+        self.measuring = False
+
+    def close(self):
+        """
+        Ожидание фоновых сохранений и удаление временных файлов.
+        """
+        self.paint.export_worker.wait()
+        self.tmp.cleanup()
+
+    def frame(self, *events):
+        """
+        Один кадр редактора с указанными событиями.
+
+        Args:
+            *events (pygame.event.Event): События кадра
+        """
+        for event in events:
+            pygame.event.post(event)
+        start = time.perf_counter()
+        self.paint.handle_events()
+        self.paint.draw()
+        if self.measuring:
+            self.frame_times.append(time.perf_counter() - start)
+            self.events += len(events)
+
+    def press(self, pos, button=1):
+        """
+        Нажатие кнопки мыши.
+
+        Args:
+            pos (tuple): Координаты окна (x, y)
+            button (int): Номер кнопки мыши
+        """
+        self.frame(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=button))
+
+    def release(self, pos, button=1):
+        """
+        Отпускание кнопки мыши.
+
+        Args:
+            pos (tuple): Координаты окна (x, y)
+            button (int): Номер кнопки мыши
+        """
+        self.frame(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=button))
+
+    def move(self, *positions):
+        """
+        Движение мыши с нажатой левой кнопкой в одном кадре.
+
+        Args:
+            *positions (tuple): Координаты окна (x, y) по порядку
+        """
+        self.frame(
+            *(
+                pygame.event.Event(
+                    pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(1, 0, 0)
+                )
+                for pos in positions
+            )
+        )
+
+    def click(self, pos, button=1):
+        """
+        Нажатие и отпускание кнопки мыши в одной точке.
+
+        Args:
+            pos (tuple): Координаты окна (x, y)
+            button (int): Номер кнопки мыши
+        """
+        self.press(pos, button)
+        self.release(pos, button)
+
+    def key(self, key):
+        """
+        Нажатие клавиши.
+
+        Args:
+            key (int): Код клавиши pygame
+        """
+        self.frame(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0))
+
+    def select(self, button):
+        """
+        Нажатие кнопки меню.
+
+        Args:
+            button (str): Название кнопки из BUTTONS
+        """
+        self.click(BUTTONS[button])
+
+    def stroke(self, points, per_frame=1):
+        """
+        Проведение мышью с нажатой левой кнопкой по точкам.
+
+        Args:
+            points (numpy.ndarray): Точки (x, y) в координатах окна
+            per_frame (int): Количество движений мыши в одном кадре
+        """
+        points = [tuple(int(c) for c in point) for point in np.asarray(points)]
+        self.press(points[0])
+        for i in range(1, len(points), per_frame):
+            self.move(*points[i : i + per_frame])
+        self.release(points[-1])
+
+    def wait_import(self, timeout=60):
+        """
+        Кадры без событий до загрузки всех копий фонового изображения.
+
+        Args:
+            timeout (float): Максимальное время ожидания в секундах
+        """
+        deadline = time.perf_counter() + timeout
+        while self.paint.importing or (
+            self.paint.backdrop and self.paint.backdrop.pending
+        ):
+            if time.perf_counter() > deadline:
+                raise TimeoutError("import did not finish")
+            self.frame()
+            time.sleep(0.001)
+
+    def wait_export(self, timeout=60):
+        """
+        Кадры без событий до завершения всех фоновых сохранений.
+        Время кадров при этом показывает отзывчивость интерфейса.
+
+        Args:
+            timeout (float): Максимальное время ожидания в секундах
+        """
+        deadline = time.perf_counter() + timeout
+        while any(self.paint.exports_in_progress.values()):
+            if time.perf_counter() > deadline:
+                raise TimeoutError("export did not finish")
+            self.frame()
+            time.sleep(0.001)
@@ -0,0 +1,297 @@
+"""
+MyPaint - Сценарии бенчмарков
+Copyright (c) 2025 Denis Korabelnikov
+
+Каждый сценарий готовит лист, затем между driver.start() и driver.stop()
+выполняет измеряемые действия. Случайные данные берутся с фиксированным
+зерном, поэтому запуски повторяемы.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pygame
+
+SCENARIOS = {}
+
+
+def scenario(func):
+    """
+    Регистрация сценария под именем функции.
+
+    Args:
+        func (callable): Функция сценария, принимающая Driver
+
+    Returns:
+        callable: Та же функция
+    """
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def sheet(grid_size):
+    """
+    Размер листа сценария, если он отличается от стандартного.
+
+    Args:
+        grid_size (tuple): Размер листа в клетках
+
+    Returns:
+        callable: Декоратор функции сценария
+    """
+
+    def decorator(func):
+        func.grid_size = grid_size
+        return func
+
+    return decorator
+
+
+def scribble(count, center=(500, 450), radius=(420, 300), turns=7):
+    """
+    Точки длинной петляющей линии по фигуре Лиссажу внутри листа.
+
+    Args:
+        count (int): Количество точек
+        center (tuple): Центр фигуры в координатах окна
+        radius (tuple): Полуоси фигуры
+        turns (int): Количество витков
+
+    Returns:
+        numpy.ndarray: Точки формы (count, 2)
+    """
+    t = np.linspace(0, 2 * np.pi * turns, count)
+    return np.column_stack(
+        (
+            center[0] + radius[0] * np.sin(3 * t / turns),
+            center[1] + radius[1] * np.sin(2 * t / turns + t),
+        )
+    )
+
+
+def random_strokes(driver, count, seed=0):
+    """
+    Рисование коротких штрихов карандашом в случайных местах листа.
+
+    Args:
+        driver (Driver): Управляемый редактор
+        count (int): Количество штрихов
+        seed (int): Зерно генератора случайных чисел
+    """
+    rng = np.random.default_rng(seed)
+    driver.select("pencil")
+    for _ in range(count):
+        start = rng.integers((40, 140), (940, 760))
+        steps = rng.integers(-60, 61, size=(4, 2))
+        driver.stroke(np.clip(start + np.cumsum(steps, axis=0), (20, 120), (979, 779)))
+
+
+@scenario
+def pencil_scribble(driver):
+    """
+    Один длинный штрих карандашом из 3000 движений мыши.
+    """
+    driver.select("pencil")
+    driver.start()
+    driver.stroke(scribble(3000))
+    driver.stop()
+
+
+@scenario
+def pencil_bursts(driver):
+    """
+    Тот же штрих по 8 движений мыши за кадр, как при частом опросе мыши.
+    """
+    driver.select("pencil")
+    driver.start()
+    driver.stroke(scribble(3000), per_frame=8)
+    driver.stop()
+
+
+@scenario
+def many_strokes(driver):
+    """
+    Добавление 500 коротких штрихов: фиксация и история действий.
+    """
+    driver.start()
+    random_strokes(driver, 500)
+    driver.stop()
+
+
+@scenario
+def eraser_sweeps(driver):
+    """
+    Проходы ластиком зигзагом по листу с 1000 штрихов.
+    """
+    random_strokes(driver, 1000)
+    driver.select("eraser")
+    zigzag = [(x, 140 + (x // 40 % 2) * 620) for x in range(30, 970, 10)]
+    driver.start()
+    for _ in range(3):
+        driver.stroke(zigzag)
+    driver.stop()
+
+
+@scenario
+def zoom(driver):
+    """
+    200 шагов масштабирования колесиком на листе с 300 штрихами.
+    """
+    random_strokes(driver, 300)
+    driver.start()
+    for i in range(200):
+        driver.press((500, 450), 4 if i // 3 % 2 else 5)
+    driver.stop()
+
+
+@scenario
+def ellipses(driver):
+    """
+    Предпросмотр большого эллипса при 400 движениях мыши.
+    """
+    driver.select("ellipse")
+    driver.start()
+    driver.stroke([(40, 140)] + [(960 - i, 760 - i // 2) for i in range(0, 800, 2)])
+    driver.stop()
+
+
+@scenario
+def arcs(driver):
+    """
+    Предпросмотр большой дуги при 400 движениях мыши.
+    """
+    driver.select("arc")
+    driver.start()
+    driver.stroke([(60, 700)] + [(940 - i, 160 + i // 4) for i in range(0, 800, 2)])
+    driver.stop()
+
+
+@scenario
+def bucket_fill(driver):
+    """
+    200 заливок разными цветами на листе с 300 штрихами:
+    поочередно весь фон листа и небольшие области между штрихами.
+    """
+    random_strokes(driver, 300)
+    driver.select("fill")
+    rng = np.random.default_rng(1)
+    driver.start()
+    for i in range(200):
+        driver.paint.brush_color = tuple(rng.integers(0, 256, 3).tolist())
+        driver.click((30, 130) if i % 2 else tuple(rng.integers((40, 140), (940, 760))))
+    driver.stop()
+
+
+@scenario
+def layers(driver):
+    """
+    Штрих карандашом из 3000 движений мыши на среднем из 8 слоев
+    по 60 штрихов с полупрозрачными слоями над ним и под ним.
+    """
+    for i in range(8):
+        if i:
+            driver.key(pygame.K_n)
+        if i % 3 == 1:
+            driver.key(pygame.K_MINUS)
+        random_strokes(driver, 60, seed=i)
+    for _ in range(4):
+        driver.key(pygame.K_PAGEDOWN)
+    driver.start()
+    driver.stroke(scribble(3000))
+    driver.stop()
+
+
+@scenario
+def autosave(driver):
+    """
+    300 штрихов и проходы ластиком с записью каждого изменения
+    в журнал автосохранения: сбор изменений в кадре и запись в фоне.
+    """
+    from autosave import Autosave  # Модули редактора доступны после Driver
+
+    paint = driver.paint
+    with tempfile.TemporaryDirectory() as folder:
+        paint.autosave = Autosave(os.path.join(folder, "autosave.mypaint"), 0)
+        paint.autosave.start()
+        driver.start()
+        random_strokes(driver, 300)
+        driver.select("eraser")
+        for y in range(160, 760, 120):
+            driver.stroke([(30, y), (970, y + 60)])
+        driver.stop()
+        paint.autosave.close()
+
+
+@scenario
+def image_import(driver):
+    """
+    Загрузка фоновой фотографии 8000x6000 и смена масштаба: кадры
+    интерфейса, пока файл декодируется в фоне.
+    """
+    rng = np.random.default_rng(0)
+    small = pygame.surfarray.make_surface(
+        rng.integers(0, 256, (800, 600, 3), dtype=np.uint8)
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "photo.jpg")
+        pygame.image.save(pygame.transform.smoothscale(small, (8000, 6000)), path)
+        random_strokes(driver, 100)
+        driver.start()
+        driver.paint.import_image(path)
+        driver.wait_import()
+        for button in (4, 5, 5):
+            driver.press((500, 450), button)
+            driver.wait_import()
+        driver.stop()
+
+
+@scenario
+def small_shapes(driver):
+    """
+    Предпросмотр небольшого прямоугольника при 400 движениях мыши
+    в максимальном масштабе, где лист занимает 1920x1320 пикселей.
+    """
+    for _ in range(2):
+        driver.press((500, 450), 4)
+    driver.select("rectangle")
+    driver.start()
+    driver.stroke(
+        [(400, 300)] + [(480 + i % 60, 380 + i // 10 % 40) for i in range(400)]
+    )
+    driver.stop()
+
+
+@scenario
+def save_png(driver):
+    """
+    Сохранение PNG в размере saving_size: задержка нажатия и кадры
+    интерфейса до завершения фонового сохранения.
+    """
+    random_strokes(driver, 300)
+    driver.start()
+    driver.select("save_png")
+    driver.wait_export()
+    driver.stop()
+
+
+@scenario
+@sheet((16384, 16384))
+def large_sheet(driver):
+    """
+    Лист 16384x16384 клеток: штрихи, прокрутка в конец листа,
+    штрих там и открытие проекта. Память должна зависеть от закрашенной
+    площади, а не от размера листа.
+    """
+    driver.start()
+    random_strokes(driver, 100)
+    paint = driver.paint
+    bar = (paint.right_scroll_bar_x + 3, paint.right_scroll_bar_y + 3)
+    driver.press(bar)
+    driver.move((bar[0], 790))
+    driver.release((bar[0], 790))
+    driver.stroke(scribble(200))
+    driver.paint.save_project()
+    driver.paint.open_project()
+    driver.frame()
+    driver.stop()
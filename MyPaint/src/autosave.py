@@ -0,0 +1,225 @@
+"""
+MyPaint - Автосохранение листа в журнал для восстановления после сбоя
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import os
+import queue
+import threading
+import time
+
+from project import ProjectFile, SheetCopy, capture
+
+
+class Autosave:
+    """
+    Журнал автосохранения в формате файла проекта.
+
+    Раз в interval секунд, если лист изменился и кнопка мыши не нажата,
+    основной поток собирает свойства слоев и штрихи, затронутые действиями
+    истории с прошлой записи, вместе с копиями их масок стирания. Копия
+    листа, блоки изменений и запись на диск обновляются и готовятся
+    в фоновом потоке, поэтому ни число штрихов на листе, ни запись
+    не увеличивают время кадра. Когда изменения в журнале по объему
+    превышают последний снимок, лист записывается заново во временный файл,
+    который атомарно заменяет журнал, поэтому журнал растет не больше чем
+    вдвое от размера листа.
+
+    При нормальном выходе журнал удаляется. Журнал, оставшийся после сбоя,
+    при следующем запуске переименовывается в "autosave-recovered.mypaint"
+    и предлагается для восстановления только в этом сеансе: при нормальном
+    выходе он удаляется, восстановлен лист или нет, а журнал более раннего
+    сбоя удаляется при запуске или заменяется журналом нового.
+
+    Attributes:
+        path (str): Путь к журналу
+        recovered_path (str): Путь к журналу прошлого сеанса или None
+        interval (float): Наименьший промежуток между записями в секундах
+        min_snapshot_bytes (int): Объем изменений, до которого журнал
+            не пересобирается
+    """
+
+    def __init__(self, path, interval=2.0, min_snapshot_bytes=2**20):
+        self.path = path
+        root, extension = os.path.splitext(path)
+        self.recovered_path = None
+        self.recovered = f"{root}-recovered{extension}"  # Журнал прошлого сеанса
+        self.interval = interval
+        self.min_snapshot_bytes = min_snapshot_bytes
+        self.journal = None  # Файл журнала, None - следующая запись будет снимком
+        self.state = None  # Состояние листа при последней записи
+        self.last_write = 0.0
+        self.queue = queue.Queue()
+        self.thread = None  # Поток записи, None - автосохранение не запущено
+        self.failed = None  # Журнал, запись в который не удалась
+        self.error = None
+        self.snapshot = (None, 0)  # Журнал последнего записанного снимка и его размер
+        self.sheet = SheetCopy()  # Копия листа, с которой работает поток записи
+
+    def start(self):
+        """
+        Запуск потока записи. Журнал прошлого сеанса сохраняется
+        для восстановления под новым именем, а оставшийся от более раннего
+        сбоя удаляется.
+
+        Returns:
+            bool: True, если найден журнал прошлого сеанса
+        """
+        found = os.path.exists(self.path)
+        if found:
+            os.replace(self.path, self.recovered)
+            self.recovered_path = self.recovered
+        elif os.path.exists(self.recovered):
+            os.remove(self.recovered)
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+        return found
+
+    def tick(self, paint):
+        """
+        Постановка изменений листа в очередь записи, если пора.
+        Вызывается в каждом кадре основного цикла.
+
+        Args:
+            paint (Paint): Редактор
+        """
+        if self.thread is None:
+            return
+        if self.error is not None:
+            print(f"Autosave error: {self.error}")
+            self.error = None
+            self.journal = self.state = None  # Журнал будет записан заново
+        now = time.monotonic()
+        if paint.drawing or now - self.last_write < self.interval:
+            return
+        self.last_write = now
+        self.submit(paint)
+
+    def timeout(self, paint):
+        """
+        Время до следующей записи для ожидания событий основным циклом.
+
+        Args:
+            paint (Paint): Редактор
+
+        Returns:
+            float: Секунды до записи изменений или None, если записывать нечего
+        """
+        if self.thread is None or paint.sheet_state() == self.state:
+            return None
+        return max(0.0, self.last_write + self.interval - time.monotonic())
+
+    def submit(self, paint, full=False):
+        """
+        Сбор изменений листа и постановка их в очередь записи.
+        Собираются только штрихи из действий истории с прошлой записи;
+        весь лист собирается при первой записи, после замены истории
+        или если история уже не помнит все изменения.
+
+        Args:
+            paint (Paint): Редактор
+            full (bool): Собрать весь лист, например с недорисованным
+                проходом ластика, которого еще нет в истории
+        """
+        state = paint.sheet_state()
+        if state == self.state and not full:
+            return
+        touched = None
+        if not full and self.state is not None and self.state[0] is state[0]:
+            actions = paint.history.changed(self.state[1])
+            if actions is not None:
+                touched = [pair for action in actions for pair in action.touched()]
+        self.state = state
+        sheet = capture(paint.layers.layers, touched)
+        target = None
+        snapshot, size = self.snapshot
+        if self.journal is None or (
+            snapshot is self.journal
+            and self.journal.end - size > max(size, self.min_snapshot_bytes)
+        ):
+            # Снимок пишется во временный файл и заменяет журнал после записи
+            target = self.path
+            self.journal = ProjectFile(f"{self.path}.tmp")
+        self.queue.put((self.journal, sheet, paint.grid_size, target))
+
+    def write_loop(self):
+        """
+        Цикл потока записи: копия листа обновляется собранными изменениями,
+        и блоки изменений дописываются в журнал по порядку.
+        """
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                journal, sheet, grid_size, target = item
+                touched = self.sheet.update(sheet)
+                if journal is self.failed:
+                    continue  # Журнал будет записан заново следующим снимком
+                if journal.end is None:
+                    touched = None  # В новый журнал пишется весь лист
+                chunks, changes = journal.changes(
+                    self.sheet.layers, self.sheet.masks, touched
+                )
+                if chunks is None:
+                    continue
+                try:
+                    if journal.end is None and os.path.exists(journal.path):
+                        os.remove(journal.path)  # Остаток прерванного снимка
+                    journal.append(chunks, grid_size)
+                    journal.accept(changes)
+                    if target is not None:
+                        os.replace(journal.path, target)
+                        journal.path = target
+                        self.snapshot = (journal, journal.end)
+                except OSError as e:
+                    self.failed = journal
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def flush(self, paint):
+        """
+        Запись всех изменений листа и ожидание окончания записи.
+
+        Args:
+            paint (Paint): Редактор
+        """
+        if self.thread is None:
+            return
+        self.submit(paint, full=True)
+        self.queue.join()
+
+    def close(self):
+        """
+        Остановка потока записи и удаление журнала при нормальном выходе.
+        Журнал прошлого сеанса тоже удаляется: его лист либо восстановлен
+        и уже записан в журнал этого сеанса, либо от восстановления отказались.
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.recovered_path = None
+        for path in (self.path, f"{self.path}.tmp", self.recovered):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def recover(self, grid_size):
+        """
+        Загрузка листа из журнала прошлого сеанса.
+
+        Args:
+            grid_size (tuple): Размер листа в клетках
+
+        Returns:
+            list: Слои листа снизу вверх
+
+        Raises:
+            OSError: Журнал не найден или не читается
+            ProjectError: Журнал поврежден или создан для листа другого размера
+        """
+        if self.recovered_path is None:
+            raise FileNotFoundError("no autosave from a previous session")
+        return ProjectFile(self.recovered_path).load(grid_size)
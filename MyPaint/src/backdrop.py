@@ -0,0 +1,249 @@
+"""
+MyPaint - Фоновое изображение листа
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import io
+import math
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from export import fit_rect, scale_image, surface_nbytes
+
+PROXY_LIMIT = 4096  # Наибольшая сторона уменьшенной копии изображения
+
+
+def proxy_size(size):
+    """
+    Размер уменьшенной копии изображения не больше PROXY_LIMIT по стороне.
+
+    Args:
+        size (tuple): Размер изображения на листе в пикселях
+
+    Returns:
+        tuple: Размер копии
+    """
+    scale = min(1.0, PROXY_LIMIT / max(size))
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def load_image(path, sheet_size, data=None):
+    """
+    Декодирование изображения и уменьшение до размера листа.
+    Выполняется в потоке импорта: декодирование и масштабирование в pygame
+    отпускают GIL, а изображение полного размера освобождается сразу
+    после уменьшения. Файл читается только при первой загрузке, копии
+    для других масштабов декодируются из его прочитанного содержимого.
+
+    Args:
+        path (str): Путь к файлу PNG или JPG
+        sheet_size (tuple): Размер листа в пикселях
+        data (bytes): Прочитанное содержимое файла, None - прочитать файл
+
+    Returns:
+        dict: Содержимое файла, размер исходного изображения,
+            уменьшенная копия и время
+    """
+    start = time.perf_counter()
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    image = pygame.image.load(io.BytesIO(data), path)
+    source_size = image.get_size()
+    proxy = scale_image(image, proxy_size(fit_rect(source_size, sheet_size).size))
+    return {
+        "data": data,
+        "source_size": source_size,
+        "proxy": proxy,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class ImportWorker:
+    """
+    Фоновая загрузка изображений в отдельном потоке. Процесс здесь не нужен:
+    декодирование не держит GIL, а в основной поток передается только
+    уменьшенная копия. О завершении каждого задания основной цикл узнает
+    из события IMPORT_DONE.
+    """
+
+    IMPORT_DONE = pygame.event.custom_type()
+
+    def __init__(self):
+        self.executor = None  # Поток запускается при первой загрузке
+
+    def submit(self, path, sheet_size, data=None):
+        """
+        Постановка изображения в очередь на загрузку.
+
+        Args:
+            path (str): Путь к файлу PNG или JPG
+            sheet_size (tuple): Размер листа в пикселях
+            data (bytes): Прочитанное содержимое файла, None - прочитать файл
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        future = self.executor.submit(load_image, path, sheet_size, data)
+        future.add_done_callback(lambda f: self.done(f, path, sheet_size))
+
+    def done(self, future, path, sheet_size):
+        """
+        Отправка события о завершении задания в очередь событий pygame.
+
+        Args:
+            future (concurrent.futures.Future): Завершенное задание
+            path (str): Путь к файлу
+            sheet_size (tuple): Размер листа в пикселях
+        """
+        result = {"path": path, "sheet_size": sheet_size}
+        try:
+            result.update(future.result())
+        except Exception as e:
+            result["error"] = str(e)
+        pygame.event.post(pygame.event.Event(self.IMPORT_DONE, result))
+
+    def wait(self):
+        """
+        Ожидание завершения всех поставленных заданий.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+class Backdrop:
+    """
+    Фоновое изображение под слоями листа.
+
+    Изображение полного размера в памяти редактора не хранится, хранится
+    только содержимое файла, прочитанное при импорте: для каждого масштаба
+    листа поток импорта декодирует его и передает копию размером с лист.
+    Пока копии для нового масштаба нет, рисуется масштабированная копия
+    для другого масштаба. Копии хранятся в кэше с ограничением по памяти.
+    Содержимое файла передается и процессу сохранения, поэтому после
+    импорта файл можно переместить или удалить.
+
+    Attributes:
+        path (str): Путь к файлу изображения при импорте
+        source_size (tuple): Размер исходного изображения
+        data (bytes): Содержимое файла изображения
+        cache_bytes (int): Максимальный объем копий в кэше
+    """
+
+    def __init__(self, path, source_size, data, cache_bytes=64 * 2**20):
+        self.path = path
+        self.source_size = tuple(source_size)
+        self.data = data
+        self.proxies = OrderedDict()  # Размер листа -> уменьшенная копия
+        self.pending = set()  # Размеры листа, для которых копия загружается
+        self.cache_bytes = cache_bytes
+
+    def request(self, worker, sheet_size):
+        """
+        Загрузка копии для размера листа, если ее еще нет.
+
+        Args:
+            worker (ImportWorker): Поток импорта
+            sheet_size (tuple): Размер листа в пикселях
+        """
+        sheet_size = tuple(sheet_size)
+        if sheet_size not in self.proxies and sheet_size not in self.pending:
+            self.pending.add(sheet_size)
+            worker.submit(self.path, sheet_size, self.data)
+
+    def add(self, sheet_size, proxy):
+        """
+        Добавление загруженной копии в кэш с вытеснением давно
+        не использованных копий.
+
+        Args:
+            sheet_size (tuple): Размер листа в пикселях
+            proxy (pygame.Surface): Уменьшенная копия
+        """
+        sheet_size = tuple(sheet_size)
+        self.pending.discard(sheet_size)
+        self.proxies[sheet_size] = proxy
+        while (
+            sum(map(surface_nbytes, self.proxies.values())) > self.cache_bytes
+            and len(self.proxies) > 1
+        ):
+            self.proxies.popitem(last=False)
+
+    def proxy(self, sheet_size):
+        """
+        Копия для размера листа или, пока ее нет, самая большая из загруженных.
+
+        Args:
+            sheet_size (tuple): Размер листа в пикселях
+
+        Returns:
+            pygame.Surface: Уменьшенная копия
+        """
+        sheet_size = tuple(sheet_size)
+        if sheet_size in self.proxies:
+            self.proxies.move_to_end(sheet_size)
+            return self.proxies[sheet_size]
+        return max(self.proxies.values(), key=lambda proxy: proxy.get_width())
+
+    def draw(self, target, origin, sheet_size):
+        """
+        Отрисовка изображения в пределах области отсечения поверхности.
+
+        Args:
+            target (pygame.Surface): Поверхность, обычно экран
+            origin (tuple): Положение левого верхнего угла листа на поверхности
+            sheet_size (tuple): Размер листа в пикселях
+        """
+        rect = fit_rect(self.source_size, sheet_size).move(origin)
+        proxy = self.proxy(sheet_size)
+        if proxy.get_size() == rect.size:
+            target.blit(proxy, rect)
+            return
+        clip = target.get_clip().clip(rect)
+        if not clip.width or not clip.height:
+            return
+        # Масштабируется только часть копии, попадающая в область отсечения
+        sx, sy = proxy.get_width() / rect.width, proxy.get_height() / rect.height
+        left = math.floor((clip.left - rect.left) * sx)
+        top = math.floor((clip.top - rect.top) * sy)
+        right = min(math.ceil((clip.right - rect.left) * sx), proxy.get_width())
+        bottom = min(math.ceil((clip.bottom - rect.top) * sy), proxy.get_height())
+        area = pygame.Rect(
+            rect.left + round(left / sx),
+            rect.top + round(top / sy),
+            round((right - left) / sx),
+            round((bottom - top) / sy),
+        )
+        part = proxy.subsurface((left, top, right - left, bottom - top))
+        target.blit(pygame.transform.scale(part, area.size), area)
+
+    def get(self, point, sheet_size):
+        """
+        Цвет изображения в точке листа.
+
+        Args:
+            point (tuple): Точка в пикселях листа
+            sheet_size (tuple): Размер листа в пикселях
+
+        Returns:
+            pygame.Color: Цвет или None, если точка вне изображения
+        """
+        rect = fit_rect(self.source_size, sheet_size)
+        if not rect.collidepoint(point):
+            return None
+        proxy = self.proxy(sheet_size)
+        x = (point[0] - rect.left) * proxy.get_width() // rect.width
+        y = (point[1] - rect.top) * proxy.get_height() // rect.height
+        return proxy.get_at((x, y))
+
+    def surfaces(self):
+        """
+        Уменьшенные копии для профилировщика.
+
+        Returns:
+            list: Поверхности копий
+        """
+        return list(self.proxies.values())
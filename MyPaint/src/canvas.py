@@ -0,0 +1,291 @@
+"""
+MyPaint - Сведенный слой из разреженных плиток
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+import raster
+from export import surface_nbytes
+
+
+class TiledCanvas:
+    """
+    Сведенный слой всех штрихов, разбитый на квадратные плитки.
+
+    Основное изображение хранится в масштабе клеток сетки кисти: все
+    инструменты рисуют целыми клетками, поэтому такие массивы без потерь
+    передают рисунок в любом масштабе, в том числе при сохранении.
+    Плитка создается при первой записи в нее и удаляется, когда в ней
+    не остается непрозрачных клеток, поэтому память пропорциональна
+    закрашенной площади, а не размеру листа.
+
+    Для отображения плитки лениво переводятся в поверхности нужного размера
+    клетки. Поверхности хранятся в кэше с ограничением по памяти и вытесняются
+    давно не использованные. Изменения сразу вносятся в поверхности текущего
+    масштаба, поверхности остальных масштабов пересобираются при обращении.
+
+    Attributes:
+        grid_size (tuple): Размер листа в клетках
+        tile (int): Сторона плитки в клетках
+        tiles (dict): Массивы RGBA формы (tile, tile, 4) по номеру плитки
+        cache_bytes (int): Максимальный объем поверхностей в кэше
+    """
+
+    def __init__(self, grid_size, tile=32, cache_bytes=128 * 2**20):
+        self.grid_size = tuple(grid_size)
+        self.tile = tile
+        self.tiles = {}
+        self.versions = {}  # Номер изменения плитки для проверки поверхностей
+        self.cache = OrderedDict()  # (размер клетки, плитка) -> [версия, поверхность]
+        self.cache_bytes = cache_bytes
+        self.surface_bytes = 0
+
+    def grid_rect(self):
+        """
+        Прямоугольник всего листа в клетках.
+
+        Returns:
+            pygame.Rect: Прямоугольник листа
+        """
+        return pygame.Rect(0, 0, *self.grid_size)
+
+    def tile_rect(self, key):
+        """
+        Прямоугольник плитки в клетках.
+
+        Args:
+            key (tuple): Номер плитки (i, j)
+
+        Returns:
+            pygame.Rect: Прямоугольник плитки
+        """
+        return pygame.Rect(key[0] * self.tile, key[1] * self.tile, self.tile, self.tile)
+
+    def keys(self, rect):
+        """
+        Номера плиток, которые пересекает прямоугольник в пределах листа.
+
+        Args:
+            rect (pygame.Rect): Прямоугольник в клетках
+
+        Returns:
+            list: Список пар (i, j)
+        """
+        rect = pygame.Rect(rect).clip(self.grid_rect())
+        if not rect.width or not rect.height:
+            return []
+        return [
+            (i, j)
+            for i in range(rect.left // self.tile, (rect.right - 1) // self.tile + 1)
+            for j in range(rect.top // self.tile, (rect.bottom - 1) // self.tile + 1)
+        ]
+
+    def read(self, rect):
+        """
+        Чтение области листа в один массив. Отсутствующие плитки прозрачны.
+
+        Args:
+            rect (pygame.Rect): Область в клетках в пределах листа
+
+        Returns:
+            numpy.ndarray: Массив RGBA формы (w, h, 4)
+        """
+        cells = np.zeros((rect.width, rect.height, 4), dtype=np.uint8)
+        for key in self.keys(rect):
+            if key not in self.tiles:
+                continue
+            area = self.tile_rect(key).clip(rect)
+            local = area.move(-key[0] * self.tile, -key[1] * self.tile)
+            cells[
+                area.left - rect.left : area.right - rect.left,
+                area.top - rect.top : area.bottom - rect.top,
+            ] = self.tiles[key][local.left : local.right, local.top : local.bottom]
+        return cells
+
+    def write(self, rect, cells, size):
+        """
+        Запись области листа из одного массива.
+
+        Args:
+            rect (pygame.Rect): Область в клетках в пределах листа
+            cells (numpy.ndarray): Массив RGBA формы (w, h, 4)
+            size (int): Размер клетки текущего масштаба
+        """
+        for key in self.keys(rect):
+            area = self.tile_rect(key).clip(rect)
+            part = cells[
+                area.left - rect.left : area.right - rect.left,
+                area.top - rect.top : area.bottom - rect.top,
+            ]
+            if key not in self.tiles and not part[..., 3].any():
+                continue
+            local = area.move(-key[0] * self.tile, -key[1] * self.tile)
+            tile = self.tile_array(key)
+            tile[local.left : local.right, local.top : local.bottom] = part
+            self.changed(key, size, lambda s: raster.write_cells(s, part, local, size))
+
+    def fill(self, cells, color, size):
+        """
+        Закраска отдельных клеток одним цветом. Прозрачный цвет стирает клетки.
+
+        Args:
+            cells (numpy.ndarray): Массив клеток (x, y) формы (N, 2)
+            color (tuple): Цвет RGB или RGBA
+            size (int): Размер клетки текущего масштаба
+        """
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        if not len(cells):
+            return
+        if cells.min() < 0 or (cells >= self.grid_size).any():
+            cells = cells[np.all((cells >= 0) & (cells < self.grid_size), axis=1)]
+            if not len(cells):
+                return
+        color = tuple(int(c) for c in color)
+        if len(color) == 3:
+            color = (*color, 255)
+        tile_keys = cells // self.tile
+        if (tile_keys == tile_keys[0]).all():
+            # Обычно все клетки одного движения мыши лежат в одной плитке
+            groups = [(tuple(tile_keys[0].tolist()), cells)]
+        else:
+            groups = [
+                (key, cells[np.all(tile_keys == key, axis=1)])
+                for key in map(tuple, raster.unique_cells(tile_keys).tolist())
+            ]
+        for key, group in groups:
+            if key not in self.tiles and color[3] == 0:
+                continue
+            local = group - np.array(key) * self.tile
+            tile = self.tile_array(key)
+            tile[local[:, 0], local[:, 1]] = color
+            # На поверхность переносится ограничивающий прямоугольник клеток
+            rect = raster.cells_bounds(local)
+            part = tile[rect.left : rect.right, rect.top : rect.bottom]
+            update = lambda s: raster.write_cells(s, part, rect, size)  # noqa: E731
+            self.changed(key, size, update, cleared=color[3] == 0)
+
+    def tile_array(self, key):
+        """
+        Массив плитки, создается прозрачным при первом обращении.
+
+        Args:
+            key (tuple): Номер плитки (i, j)
+
+        Returns:
+            numpy.ndarray: Массив RGBA формы (tile, tile, 4)
+        """
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = np.zeros((self.tile, self.tile, 4), np.uint8)
+        return tile
+
+    def changed(self, key, size, update, cleared=True):
+        """
+        Учет изменения плитки. Плитка без непрозрачных клеток удаляется,
+        поверхность текущего масштаба обновляется на месте, если она
+        была актуальна, остальные поверхности станут устаревшими.
+
+        Args:
+            key (tuple): Номер плитки (i, j)
+            size (int): Размер клетки текущего масштаба
+            update (callable): Перенос изменения на поверхность плитки
+            cleared (bool): Могли ли в плитке стереться все клетки
+        """
+        version = self.versions.get(key, 0)
+        self.versions[key] = version + 1
+        if cleared and not self.tiles[key][..., 3].any():
+            del self.tiles[key]
+            for level in list(self.cache):
+                if level[1] == key:
+                    self.drop(level)
+            return
+        entry = self.cache.get((size, key))
+        if entry and entry[0] == version:
+            update(entry[1])
+            entry[0] = version + 1
+
+    def surface(self, key, size):
+        """
+        Поверхность плитки для заданного размера клетки.
+
+        Args:
+            key (tuple): Номер плитки (i, j)
+            size (int): Размер клетки в пикселях
+
+        Returns:
+            pygame.Surface: Поверхность плитки или None, если плитка пуста
+        """
+        if key not in self.tiles:
+            return None
+        level = (size, key)
+        entry = self.cache.get(level)
+        if entry is None:
+            side = self.tile * size
+            entry = [None, pygame.Surface((side, side), pygame.SRCALPHA)]
+            self.cache[level] = entry
+            self.surface_bytes += surface_nbytes(entry[1])
+        self.cache.move_to_end(level)
+        if entry[0] != self.versions[key]:
+            rect = pygame.Rect(0, 0, self.tile, self.tile)
+            raster.write_cells(entry[1], self.tiles[key], rect, size)
+            entry[0] = self.versions[key]
+        # Вытеснение давно не использованных поверхностей, кроме текущей
+        while self.surface_bytes > self.cache_bytes and len(self.cache) > 1:
+            self.drop(next(iter(self.cache)))
+        return entry[1]
+
+    def drop(self, level):
+        """
+        Удаление поверхности плитки из кэша.
+
+        Args:
+            level (tuple): Размер клетки и номер плитки
+        """
+        _, surface = self.cache.pop(level)
+        self.surface_bytes -= surface_nbytes(surface)
+
+    def drop_surfaces(self):
+        """
+        Удаление всех поверхностей из кэша, плитки сохраняются.
+        """
+        self.cache.clear()
+        self.surface_bytes = 0
+
+    def draw(self, target, origin, size, opacity=255):
+        """
+        Отрисовка плиток, попадающих в область отсечения поверхности.
+
+        Args:
+            target (pygame.Surface): Поверхность, обычно экран
+            origin (tuple): Положение левого верхнего угла листа на поверхности
+            size (int): Размер клетки в пикселях
+            opacity (int): Непрозрачность плиток от 0 до 255
+        """
+        clip = target.get_clip().move(-origin[0], -origin[1])
+        left, top = clip.left // size, clip.top // size
+        rect = pygame.Rect(
+            left, top, -(-clip.right // size) - left, -(-clip.bottom // size) - top
+        )
+        side = self.tile * size
+        for key in self.keys(rect):
+            surface = self.surface(key, size)
+            if surface is None:
+                continue
+            if opacity != 255:
+                surface.set_alpha(opacity)
+            target.blit(surface, (origin[0] + key[0] * side, origin[1] + key[1] * side))
+            if opacity != 255:
+                surface.set_alpha(255)
+
+    def clear(self):
+        """
+        Удаление всех плиток.
+        """
+        for key in self.tiles:
+            self.versions[key] = self.versions.get(key, 0) + 1
+        self.tiles.clear()
+        self.drop_surfaces()
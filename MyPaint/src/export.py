@@ -0,0 +1,300 @@
+"""
+MyPaint - Сведение изображения для сохранения
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pygame
+
+
+def surface_nbytes(surface):
+    """
+    Объем памяти пикселей поверхности.
+
+    Args:
+        surface (pygame.Surface): Поверхность
+
+    Returns:
+        int: Количество байт
+    """
+    return surface.get_pitch() * surface.get_height()
+
+
+def fit_rect(image_size, sheet_size):
+    """
+    Прямоугольник изображения, вписанного в лист по центру
+    с сохранением пропорций.
+
+    Args:
+        image_size (tuple): Размер изображения
+        sheet_size (tuple): Размер листа в пикселях
+
+    Returns:
+        pygame.Rect: Прямоугольник изображения в пикселях листа
+    """
+    scale = min(sheet_size[0] / image_size[0], sheet_size[1] / image_size[1])
+    size = (
+        max(1, round(image_size[0] * scale)),
+        max(1, round(image_size[1] * scale)),
+    )
+    return pygame.Rect(
+        ((sheet_size[0] - size[0]) // 2, (sheet_size[1] - size[1]) // 2), size
+    )
+
+
+def scale_image(image, size):
+    """
+    Масштабирование изображения со сглаживанием. Большое изображение сначала
+    уменьшается без сглаживания до удвоенного размера, что намного быстрее
+    сглаживания всех его пикселей и почти не влияет на результат.
+
+    Args:
+        image (pygame.Surface): Изображение
+        size (tuple): Итоговый размер
+
+    Returns:
+        pygame.Surface: Новое изображение
+    """
+    if image.get_bitsize() not in (24, 32):
+        image = image.convert(32, pygame.SRCALPHA)  # Сглаживание требует 24 или 32 бит
+    if image.get_width() > 2 * size[0] and image.get_height() > 2 * size[1]:
+        image = pygame.transform.scale(image, (2 * size[0], 2 * size[1]))
+    return pygame.transform.smoothscale(image, size)
+
+
+def compose_image(tiles, tile, grid_size, saving_size, background=None, image=None):
+    """
+    Сведение изображения для сохранения по плиткам.
+    Каждому столбцу и строке итогового изображения сопоставляется клетка
+    листа, поэтому плитки переносятся на результат независимо друг от друга,
+    а пустые плитки не обрабатываются. Клетки плитки масштабируются сразу
+    в ее область на результате, другие буферы итогового размера не создаются.
+
+    Args:
+        tiles (dict): Массивы плиток RGBA (tile, tile, 4) по номеру плитки
+        tile (int): Сторона плитки в клетках
+        grid_size (tuple): Размер листа в клетках
+        saving_size (tuple): Размер итогового изображения
+        background (tuple): Цвет непрозрачного фона RGB, None - сохранить
+            прозрачность
+        image (tuple): Фоновое изображение под слоями и его положение
+            или None
+
+    Returns:
+        tuple: Итоговая поверхность и пиковый объем памяти буферов в байтах
+    """
+    # Номер клетки для каждого столбца и строки итогового изображения
+    xs = np.arange(saving_size[0]) * grid_size[0] // saving_size[0]
+    ys = np.arange(saving_size[1]) * grid_size[1] // saving_size[1]
+    if background is None:
+        flags = pygame.SRCALPHA
+        surface = pygame.Surface(saving_size, flags)
+    else:
+        flags = 0
+        surface = pygame.Surface(saving_size)
+        surface.fill(background)
+        background = np.array(background, np.uint16)
+    if image is not None:
+        surface.blit(*image)
+
+    temp_bytes = 0
+    for (i, j), cells in tiles.items():
+        left, right = np.searchsorted(xs, (i * tile, (i + 1) * tile))
+        top, bottom = np.searchsorted(ys, (j * tile, (j + 1) * tile))
+        if left == right or top == bottom:
+            continue
+        # Клетки плитки, попадающие в изображение
+        cells = cells[
+            xs[left] - i * tile : xs[right - 1] - i * tile + 1,
+            ys[top] - j * tile : ys[bottom - 1] - j * tile + 1,
+        ]
+        area = pygame.Rect(left, top, right - left, bottom - top)
+        if image is not None:
+            # Клетки накладываются на фоновое изображение уже в итоговом масштабе
+            small = pygame.Surface(cells.shape[:2], pygame.SRCALPHA)
+            pygame.surfarray.pixels3d(small)[...] = cells[..., :3]
+            pygame.surfarray.pixels_alpha(small)[...] = cells[..., 3]
+            scaled = pygame.transform.scale(small, area.size)
+            surface.blit(scaled, area)
+            temp_bytes = max(temp_bytes, surface_nbytes(scaled))
+            continue
+        small = pygame.Surface(cells.shape[:2], flags, surface)
+        if background is None:
+            pygame.surfarray.pixels3d(small)[...] = cells[..., :3]
+            pygame.surfarray.pixels_alpha(small)[...] = cells[..., 3]
+        else:
+            # Наложение клеток на фон выполняется в масштабе клеток
+            alpha = cells[..., 3:].astype(np.uint16)
+            pygame.surfarray.pixels3d(small)[...] = (
+                cells[..., :3] * alpha + background * (255 - alpha)
+            ) // 255
+        pygame.transform.scale(small, area.size, surface.subsurface(area))
+        temp_bytes = max(temp_bytes, surface_nbytes(small))
+
+    peak = temp_bytes + surface_nbytes(surface)
+    if image is not None:
+        peak += surface_nbytes(image[0])
+    return surface, peak
+
+
+def next_image_path(image_dir, extension):
+    """
+    Первое свободное имя файла вида "drawing_png (1).png".
+
+    Args:
+        image_dir (str): Папка для сохранения
+        extension (str): Расширение файла
+
+    Returns:
+        str: Путь к файлу
+    """
+    i = 1
+    while os.path.exists(
+        os.path.join(image_dir, f"drawing_{extension} ({i}).{extension}")
+    ):
+        i += 1
+    return os.path.join(image_dir, f"drawing_{extension} ({i}).{extension}")
+
+
+def save_image(
+    tiles, tile, grid_size, saving_size, extension, background, image_dir, image=None
+):
+    """
+    Сведение, кодирование и запись изображения в файл.
+    Выполняется в процессе сохранения. Фоновое изображение декодируется
+    здесь из содержимого файла, прочитанного при импорте.
+
+    Args:
+        tiles (dict): Снимок плиток сведенного слоя
+        tile (int): Сторона плитки в клетках
+        grid_size (tuple): Размер листа в клетках
+        saving_size (tuple): Размер итогового изображения
+        extension (str): Расширение файла ("jpg" или "png")
+        background (tuple): Цвет фона RGB или None
+        image_dir (str): Папка для сохранения
+        image (bytes): Содержимое файла фонового изображения или None
+
+    Returns:
+        dict: Путь к файлу, время и пиковая память буферов
+    """
+    start = time.perf_counter()
+    decode_bytes = 0
+    if image is not None:
+        source = pygame.image.load(io.BytesIO(image))
+        rect = fit_rect(source.get_size(), saving_size)
+        image = (scale_image(source, rect.size), rect)
+        # Исходное изображение полного размера и его уменьшенная копия
+        # существуют одновременно до освобождения исходного
+        decode_bytes = surface_nbytes(source) + surface_nbytes(image[0])
+        del source
+    surface, peak = compose_image(
+        tiles, tile, grid_size, saving_size, background, image
+    )
+    peak = max(peak, decode_bytes)
+    os.makedirs(image_dir, exist_ok=True)
+    path = next_image_path(image_dir, extension)
+    pygame.image.save(surface, path)
+    return {
+        "path": path,
+        "seconds": time.perf_counter() - start,
+        "peak_bytes": peak,
+    }
+
+
+class ExportWorker:
+    """
+    Фоновое сохранение изображений в отдельном процессе.
+    Кодирование PNG и JPG в pygame не отпускает GIL, поэтому поток не спасает
+    интерфейс от зависания, а процесс получает только снимок непустых плиток.
+    Задания выполняются по очереди, поэтому несколько сохранений можно
+    запустить подряд, не дожидаясь окончания предыдущих. О завершении
+    каждого задания основной цикл узнает из события EXPORT_DONE.
+    Если процесс аварийно завершился, при следующем сохранении
+    он запускается заново.
+    """
+
+    EXPORT_DONE = pygame.event.custom_type()
+
+    def __init__(self):
+        self.executor = None  # Процесс запускается при первом сохранении
+
+    def submit(self, canvas, saving_size, extension, background, image_dir, image=None):
+        """
+        Постановка изображения в очередь на сохранение.
+
+        Args:
+            canvas (LayerStack): Слои листа, в процесс передается снимок
+                плиток их наложения
+            saving_size (tuple): Размер итогового изображения
+            extension (str): Расширение файла ("jpg" или "png")
+            background (tuple): Цвет фона RGB или None
+            image_dir (str): Папка для сохранения
+            image (bytes): Содержимое файла фонового изображения или None
+        """
+        job = (
+            save_image,
+            canvas.snapshot(),
+            canvas.tile,
+            canvas.grid_size,
+            saving_size,
+            extension,
+            background,
+            image_dir,
+            image,
+        )
+        try:
+            try:
+                future = self.pool().submit(*job)
+            except BrokenProcessPool:
+                # Процесс сохранения завершился аварийно, пул создается заново
+                self.executor.shutdown(wait=False)
+                self.executor = None
+                future = self.pool().submit(*job)
+        except (BrokenProcessPool, OSError) as e:
+            # Ошибка запуска сообщается так же, как ошибка сохранения
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda f: self.done(f, extension))
+
+    def pool(self):
+        """
+        Пул из одного процесса сохранения, запускается при первом обращении.
+
+        Returns:
+            ProcessPoolExecutor: Пул процессов
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    def done(self, future, extension):
+        """
+        Отправка события о завершении задания в очередь событий pygame.
+
+        Args:
+            future (concurrent.futures.Future): Завершенное задание
+            extension (str): Расширение файла
+        """
+        result = {"extension": extension}
+        try:
+            result.update(future.result())
+        except Exception as e:
+            result["error"] = str(e)
+        pygame.event.post(pygame.event.Event(self.EXPORT_DONE, result))
+
+    def wait(self):
+        """
+        Ожидание завершения всех поставленных заданий.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -0,0 +1,252 @@
+"""
+MyPaint - История действий для отмены и повтора
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+from collections import deque
+
+import numpy as np
+
+import raster
+
+
+class Stroke:
+    """
+    Завершенный штрих в виде примитива: инструмент, цвет и клетки сетки кисти.
+
+    Все инструменты рисуют по сетке кисти, поэтому набор клеток описывает штрих
+    точно и не зависит от масштаба: изображение штриха для любого размера клетки
+    получается повторной растеризацией. Клетки, стертые ластиком, отмечаются
+    маской, которая создается только при первом стирании.
+
+    Attributes:
+        tool (str): Инструмент, которым нарисован штрих
+        color (tuple): Цвет RGBA
+        cells (numpy.ndarray): Клетки штриха на листе, массив формы (N, 2)
+        rect (pygame.Rect): Ограничивающий прямоугольник в клетках
+        erased (numpy.ndarray): Маска стертых клеток формы (w, h) или None
+    """
+
+    def __init__(self, tool, color, cells, rect=None):
+        self.tool = tool
+        color = tuple(int(c) for c in color)
+        self.color = color if len(color) == 4 else (*color, 255)
+        self.cells = np.asarray(cells, dtype=np.int32).reshape(-1, 2)
+        self.rect = rect or raster.cells_bounds(self.cells)
+        self.erased = None
+
+    def mask(self):
+        """
+        Клетки штриха внутри ограничивающего прямоугольника без учета стирания.
+
+        Returns:
+            numpy.ndarray: Булев массив формы (w, h)
+        """
+        mask = np.zeros(self.rect.size, dtype=bool)
+        mask[self.cells[:, 0] - self.rect.x, self.cells[:, 1] - self.rect.y] = True
+        return mask
+
+    def erase(self, local):
+        """
+        Стирание клеток штриха.
+
+        Args:
+            local (numpy.ndarray): Клетки относительно штриха формы (N, 2)
+        """
+        if self.erased is None:
+            self.erased = np.zeros(self.rect.size, dtype=bool)
+        self.erased[local[:, 0], local[:, 1]] = True
+
+    def visible_cells(self):
+        """
+        Клетки штриха, не стертые ластиком.
+
+        Returns:
+            numpy.ndarray: Клетки на листе формы (N, 2)
+        """
+        if self.erased is None:
+            return self.cells
+        local = self.cells - self.rect.topleft
+        return self.cells[~self.erased[local[:, 0], local[:, 1]]]
+
+
+class AddStroke:
+    """
+    Действие добавления штриха на слой.
+    """
+
+    def __init__(self, layer, stroke):
+        self.layer = layer
+        self.stroke = stroke
+
+    def undo(self, layers):
+        self.layer.strokes.remove(self.stroke)
+        return self.layer, self.stroke.rect
+
+    def redo(self, layers):
+        self.layer.strokes.append(self.stroke)
+        return self.layer, self.stroke.rect
+
+    def touched(self):
+        return [(self.layer, self.stroke)]
+
+
+class EraseStrokes:
+    """
+    Действие прохода ластиком.
+    Хранит для каждого затронутого штриха только фрагменты маски стирания
+    внутри области прохода: до и после него.
+
+    Attributes:
+        layer (Layer): Слой, на котором прошел ластик
+        rect (pygame.Rect): Область прохода ластика в клетках
+        patches (list): Список кортежей (штрих, область, до, после),
+            область задана в клетках относительно штриха
+    """
+
+    def __init__(self, layer, rect, patches):
+        self.layer = layer
+        self.rect = rect
+        self.patches = patches
+
+    def undo(self, layers):
+        for stroke, area, before, _ in self.patches:
+            stroke.erased[area.left : area.right, area.top : area.bottom] = before
+        return self.layer, self.rect
+
+    def redo(self, layers):
+        for stroke, area, _, after in self.patches:
+            stroke.erased[area.left : area.right, area.top : area.bottom] = after
+        return self.layer, self.rect
+
+    def touched(self):
+        return [(self.layer, stroke) for stroke, *_ in self.patches]
+
+
+class AddLayer:
+    """
+    Действие добавления слоя. Изменение состава слоев возвращается
+    как слой None: требуется пересборка кэшей наложения. Затронутым
+    считается весь слой.
+    """
+
+    def __init__(self, layer, index):
+        self.layer = layer
+        self.index = index
+
+    def undo(self, layers):
+        layers.remove(self.layer)
+        return None, None
+
+    def redo(self, layers):
+        layers.insert(self.index, self.layer)
+        return None, None
+
+    def touched(self):
+        return [(self.layer, None)]
+
+
+class RemoveLayer(AddLayer):
+    """
+    Действие удаления слоя.
+    """
+
+    def undo(self, layers):
+        return super().redo(layers)
+
+    def redo(self, layers):
+        return super().undo(layers)
+
+
+class History:
+    """
+    Ограниченная история действий с возможностью отмены и повтора.
+    Каждое действие умеет назвать затронутые штрихи (метод touched),
+    а история помнит, какие действия применялись в последних изменениях,
+    чтобы автосохранение собирало только их, а не весь лист.
+
+    Attributes:
+        limit (int): Максимальное количество действий, доступных для отмены
+        version (int): Номер изменения, растет при каждом добавлении,
+            отмене и повторе действия
+        log (collections.deque): Последние изменения, пары (версия, действие)
+    """
+
+    def __init__(self, limit=100, log_limit=1000):
+        self.limit = limit
+        self.undo_stack = deque(maxlen=limit)
+        self.redo_stack = []
+        self.version = 0
+        self.log = deque(maxlen=log_limit)
+
+    def changed(self, version):
+        """
+        Действия, добавленные, отмененные или повторенные после версии.
+
+        Args:
+            version (int): Версия истории, например при прошлой записи
+
+        Returns:
+            list: Действия по порядку или None, если журнал изменений
+                не хранит их все
+        """
+        if version == self.version:
+            return []
+        if not self.log or self.log[0][0] > version + 1:
+            return None
+        return [action for number, action in self.log if number > version]
+
+    def record(self, action):
+        """
+        Учет изменения листа действием.
+
+        Args:
+            action: Добавленное, отмененное или повторенное действие
+        """
+        self.version += 1
+        self.log.append((self.version, action))
+
+    def push(self, action):
+        """
+        Добавление нового действия. Очищает список действий для повтора.
+
+        Args:
+            action: Действие с методами undo и redo
+        """
+        self.undo_stack.append(action)
+        self.redo_stack.clear()
+        self.record(action)
+
+    def undo(self, layers):
+        """
+        Отмена последнего действия.
+
+        Args:
+            layers (LayerStack): Слои листа
+
+        Returns:
+            tuple: Измененный слой и область в клетках или None
+        """
+        if not self.undo_stack:
+            return None
+        action = self.undo_stack.pop()
+        self.redo_stack.append(action)
+        self.record(action)
+        return action.undo(layers)
+
+    def redo(self, layers):
+        """
+        Повтор последнего отмененного действия.
+
+        Args:
+            layers (LayerStack): Слои листа
+
+        Returns:
+            tuple: Измененный слой и область в клетках или None
+        """
+        if not self.redo_stack:
+            return None
+        action = self.redo_stack.pop()
+        self.undo_stack.append(action)
+        self.record(action)
+        return action.redo(layers)
@@ -0,0 +1,310 @@
+"""
+MyPaint - Слои листа и кэши их наложения
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import numpy as np
+import pygame
+
+from canvas import TiledCanvas
+from spatial import StrokeIndex
+
+
+class Layer:
+    """
+    Слой листа: штрихи слоя и их сведенное изображение.
+
+    Attributes:
+        name (str): Название слоя
+        strokes (StrokeIndex): Штрихи слоя в порядке рисования
+        canvas (TiledCanvas): Сведенное изображение штрихов слоя
+        visible (bool): Отображается ли слой
+        opacity (int): Непрозрачность слоя от 0 до 255
+        locked (bool): Запрещено ли рисование на слое
+    """
+
+    def __init__(self, name, grid_size, visible=True, opacity=255, locked=False):
+        self.name = name
+        self.strokes = StrokeIndex()
+        self.canvas = TiledCanvas(grid_size)
+        self.visible = visible
+        self.opacity = opacity
+        self.locked = locked
+
+    def editable(self):
+        """
+        Можно ли рисовать на слое: скрытый и заблокированный слои не меняются.
+
+        Returns:
+            bool: True, если слой видим и не заблокирован
+        """
+        return self.visible and not self.locked
+
+
+class LayerStack:
+    """
+    Слои листа снизу вверх и активный слой.
+
+    Видимые слои под активным и над ним сводятся с учетом непрозрачности
+    в два кэша из плиток. Кадр рисует нижний кэш, активный слой и верхний кэш,
+    поэтому рисование на активном слое смешивает три изображения независимо
+    от количества слоев и штрихов. Кэши пересобираются при смене активного
+    слоя и в плитках, где изменился другой слой.
+
+    Attributes:
+        grid_size (tuple): Размер листа в клетках
+        layers (list): Слои снизу вверх
+        active (Layer): Активный слой
+        below (TiledCanvas): Наложение видимых слоев под активным
+        above (TiledCanvas): Наложение видимых слоев над активным
+    """
+
+    def __init__(self, grid_size, layers=None):
+        self.grid_size = tuple(grid_size)
+        self.layers = layers or [Layer("Layer 1", self.grid_size)]
+        self.active = self.layers[-1]
+        self.below = TiledCanvas(self.grid_size)
+        self.above = TiledCanvas(self.grid_size)
+        self.tile = self.below.tile
+
+    def index(self):
+        """
+        Номер активного слоя снизу вверх.
+
+        Returns:
+            int: Номер слоя
+        """
+        return self.layers.index(self.active)
+
+    def new_name(self):
+        """
+        Название нового слоя, не совпадающее с названиями существующих.
+
+        Returns:
+            str: Название вида "Layer N"
+        """
+        names = {layer.name for layer in self.layers}
+        number = len(self.layers) + 1
+        while f"Layer {number}" in names:
+            number += 1
+        return f"Layer {number}"
+
+    def insert(self, index, layer):
+        """
+        Добавление слоя, который становится активным.
+        После изменения состава слоев нужна пересборка кэшей наложения.
+
+        Args:
+            index (int): Номер нового слоя снизу вверх
+            layer (Layer): Слой
+        """
+        self.layers.insert(index, layer)
+        self.select(layer)
+
+    def remove(self, layer):
+        """
+        Удаление слоя. Активным становится слой под удаленным.
+
+        Args:
+            layer (Layer): Слой
+
+        Returns:
+            int: Номер удаленного слоя
+        """
+        index = self.layers.index(layer)
+        self.layers.remove(layer)
+        if layer is self.active:
+            self.active = self.layers[max(index - 1, 0)]
+        layer.canvas.drop_surfaces()
+        return index
+
+    def select(self, layer):
+        """
+        Смена активного слоя. Поверхности прежнего активного слоя больше
+        не отображаются, он входит в кэши наложения.
+
+        Args:
+            layer (Layer): Новый активный слой
+        """
+        if layer is not self.active:
+            self.active.canvas.drop_surfaces()
+            self.active = layer
+
+    def rebuild(self, size):
+        """
+        Полная пересборка кэшей под активным слоем и над ним.
+
+        Args:
+            size (int): Размер клетки текущего масштаба
+        """
+        index = self.index()
+        for target, layers in (
+            (self.below, self.layers[:index]),
+            (self.above, self.layers[index + 1 :]),
+        ):
+            target.clear()
+            keys = set()
+            for layer in layers:
+                if layer.visible:
+                    keys.update(layer.canvas.tiles)
+            self.compose(target, layers, keys, size)
+
+    def changed(self, layer, rect, size):
+        """
+        Учет изменения неактивного слоя: пересборка плиток кэша,
+        в который входит слой.
+
+        Args:
+            layer (Layer): Измененный слой
+            rect (pygame.Rect): Измененная область в клетках
+            size (int): Размер клетки текущего масштаба
+        """
+        if layer is self.active:
+            return
+        index, position = self.index(), self.layers.index(layer)
+        if position < index:
+            target, layers = self.below, self.layers[:index]
+        else:
+            target, layers = self.above, self.layers[index + 1 :]
+        self.compose(target, layers, target.keys(rect), size)
+
+    def compose(self, target, layers, keys, size):
+        """
+        Наложение видимых слоев в плитках кэша.
+
+        Args:
+            target (TiledCanvas): Кэш наложения
+            layers (list): Слои снизу вверх
+            keys (iterable): Номера пересобираемых плиток
+            size (int): Размер клетки текущего масштаба
+        """
+        grid = target.grid_rect()
+        for key in keys:
+            cells = np.zeros((target.tile, target.tile, 4), dtype=np.uint8)
+            for layer in layers:
+                tile = layer.canvas.tiles.get(key)
+                if layer.visible and tile is not None:
+                    cells = blend(cells, tile, layer.opacity)
+            rect = target.tile_rect(key).clip(grid)
+            target.write(rect, cells[: rect.width, : rect.height], size)
+
+    def draw(self, target, origin, size, overlay=None):
+        """
+        Отрисовка листа: нижний кэш, активный слой и верхний кэш.
+
+        Args:
+            target (pygame.Surface): Поверхность, обычно экран
+            origin (tuple): Положение левого верхнего угла листа на поверхности
+            size (int): Размер клетки в пикселях
+            overlay (tuple): Поверхность и ее положение на target, которые
+                рисуются поверх активного слоя с его непрозрачностью,
+                например предпросмотр фигуры
+        """
+        self.below.draw(target, origin, size)
+        if self.active.visible:
+            self.active.canvas.draw(target, origin, size, self.active.opacity)
+            if overlay:
+                surface, position = overlay
+                surface.set_alpha(self.active.opacity)
+                target.blit(surface, position)
+        self.above.draw(target, origin, size)
+
+    def read(self, rect):
+        """
+        Чтение наложения всех видимых слоев в один массив.
+
+        Args:
+            rect (pygame.Rect): Область в клетках в пределах листа
+
+        Returns:
+            numpy.ndarray: Массив RGBA формы (w, h, 4)
+        """
+        cells = None
+        for layer in self.layers:
+            if not layer.visible:
+                continue
+            part = layer.canvas.read(rect)
+            if cells is None and layer.opacity == 255:
+                cells = part
+            else:
+                if cells is None:
+                    cells = np.zeros_like(part)
+                cells = blend(cells, part, layer.opacity)
+        if cells is None:
+            cells = np.zeros((rect.width, rect.height, 4), dtype=np.uint8)
+        return cells
+
+    def get(self, x, y):
+        """
+        Цвет одной клетки наложения всех видимых слоев.
+
+        Args:
+            x (int): Номер столбца
+            y (int): Номер строки
+
+        Returns:
+            numpy.ndarray: Цвет RGBA
+        """
+        return self.read(pygame.Rect(x, y, 1, 1))[0, 0]
+
+    def snapshot(self):
+        """
+        Плитки наложения всех видимых слоев для сохранения изображения.
+
+        Returns:
+            dict: Массивы плиток по номеру плитки
+        """
+        tiles = {}
+        keys = set()
+        for layer in self.layers:
+            if layer.visible:
+                keys.update(layer.canvas.tiles)
+        for key in keys:
+            cells = np.zeros((self.tile, self.tile, 4), dtype=np.uint8)
+            for layer in self.layers:
+                tile = layer.canvas.tiles.get(key)
+                if layer.visible and tile is not None:
+                    cells = blend(cells, tile, layer.opacity)
+            if cells[..., 3].any():
+                tiles[key] = cells
+        return tiles
+
+    def surfaces(self):
+        """
+        Поверхности кэшей всех слоев для профилировщика.
+
+        Yields:
+            pygame.Surface: Поверхность плитки
+        """
+        for canvas in (
+            self.below,
+            self.above,
+            *(layer.canvas for layer in self.layers),
+        ):
+            for _, surface in canvas.cache.values():
+                yield surface
+
+
+def blend(dst, src, opacity=255):
+    """
+    Наложение изображения src с непрозрачностью opacity поверх dst
+    (операция source over для цветов без предварительного умножения на альфу).
+    Если dst прозрачен или src непрозрачен, результат точно равен src.
+
+    Args:
+        dst (numpy.ndarray): Нижнее изображение RGBA формы (..., 4)
+        src (numpy.ndarray): Верхнее изображение RGBA той же формы
+        opacity (int): Непрозрачность src от 0 до 255
+
+    Returns:
+        numpy.ndarray: Результат RGBA uint8
+    """
+    top = src[..., 3:].astype(np.float32) * np.float32(opacity / 255)
+    bottom = dst[..., 3:] * (1 - top / 255)
+    alpha = top + bottom
+    rgb = src[..., :3] * top + dst[..., :3] * bottom
+    np.divide(rgb, alpha, out=rgb, where=alpha > 0)
+    result = np.empty_like(dst)
+    result[..., :3] = np.rint(rgb)
+    result[..., 3:] = np.rint(alpha)
+    return result
@@ -4,9 +4,21 @@ Copyright (c) 2025 Denis Korabelnikov
 """
 
 import pygame
+import argparse
 import math
 import numpy as np
 import os
+import time
+
+from autosave import Autosave
+from backdrop import Backdrop, ImportWorker
+from export import ExportWorker
+from history import AddLayer, AddStroke, EraseStrokes, History, RemoveLayer, Stroke
+from layers import Layer, LayerStack
+from profiler import FrameProfiler, render_hud
+from project import ProjectError, ProjectFile, free_path, latest_path, parse_grid
+from replay import EventRecorder
+import raster
 
 
 class Color:
@@ -19,6 +31,7 @@ class Color:
     BLACK = (0, 0, 0)
     SCROLL_BAR_NOT_ACTIVE = (164, 168, 177)
     SCROLL_BAR_ACTIVE = (100, 104, 112)
+    ICON = (208, 217, 232)
     colors = np.array(
         [
             [
@@ -58,26 +71,41 @@ class Paint:
         HEIGHT (int): Высота окна программы
         WIDTH_SHEET (int): Ширина рабочей области рисования
         HEIGHT_SHEET (int): Высота рабочей области рисования
+        grid_size (tuple): Размер листа в клетках
         size (int): Размер кисти/ластика
         saving_size (tuple): Размер сохраняемого изображения
-        fps (int): Частота обновления экрана
+        fps (int): Частота кадров во время работы, в простое основной цикл
+            ждет событий
+        flash_time (float): Длительность подсветки кнопки сохранения в секундах
         scroll_bar_width (int): Ширина полосы прокрутки
+        history_limit (int): Количество действий, доступных для отмены
+        fill_limit (int): Количество клеток листа, выше которого заливка
+            ограничивается видимой частью листа
     """
 
-    def __init__(self):
+    def __init__(self, grid_size=(80, 55)):
         """
         Инициализация графического редактора.
         Создает окно, инициализирует переменные и загружает необходимые ресурсы.
+
+        Args:
+            grid_size (tuple): Размер листа в клетках
         """
         pygame.init()
         self.WIDTH = 1000
         self.HEIGHT = 800
-        self.WIDTH_SHEET = self.WIDTH - 2 * 20
-        self.HEIGHT_SHEET = self.HEIGHT - 100 - 2 * 20
+        self.grid_size = tuple(grid_size)
         self.size = 12
-        self.saving_size = (3840, 2640)
+        self.WIDTH_SHEET = self.grid_size[0] * self.size
+        self.HEIGHT_SHEET = self.grid_size[1] * self.size
+        # Изображение сохраняется с большей стороной 3840 пикселей
+        scale = 3840 / max(self.grid_size)
+        self.saving_size = tuple(round(side * scale) for side in self.grid_size)
         self.fps = 60
+        self.flash_time = 1.0
         self.scroll_bar_width = 10
+        self.history_limit = 100
+        self.fill_limit = 512 * 512
 
         self.right_scroll_bar_color = Color.SCROLL_BAR_NOT_ACTIVE
         self.down_scroll_bar_color = Color.SCROLL_BAR_NOT_ACTIVE
@@ -109,47 +137,154 @@ class Paint:
             "figure_selection": (66, 137, 14, 85),
             "save_jpg": (358, 387, 14, 44),
             "save_png": (358, 387, 55, 85),
+            "layers": (410, 609, 8, 92),
         }
+        self.COLOR_RECT = pygame.Rect(309, 59, 24, 24)  # Образец текущего цвета
+        # Допуск заливки в пустой ячейке под значком заливки
+        self.TOLERANCE_RECT = pygame.Rect(91, 63, 23, 23)
 
         # Пустые клетки для будущих фигур
         # Из массива пустые строки не удалять - возникнет ошибка при нажатии на соответствующие им кнопки
         self.figure_selection = np.array(
-            [["line", "rectangle", "ellipse"], ["arc", "", ""], ["", "", ""]]
+            [["line", "rectangle", "ellipse"], ["arc", "fill", ""], ["", "", ""]]
         )
 
         image_filename = os.path.join("..", "images", "head.png")
         self.head = pygame.image.load(image_filename)
-
-        self.counter_to_save = 0
+        self.draw_fill_icon()
+        # Панель инструментов, собранная в формате экрана, и состояние кнопок,
+        # для которого она собрана
+        self.toolbar = None
+        self.toolbar_state = None
+        self.scroll_bar_rects = []  # Прямоугольники полос прокрутки и их цвета
+
+        self.flash_end = 0.0  # Время снятия подсветки кнопки сохранения
         self.tool = "pencil"
         self.eraser = False  # Нужна для корректного сохранения цвета при переключении инструментов
         self.drawing = False
         self.is_saving_successful = False
+        self.shift_keys = set()  # Нажатые клавиши Shift по событиям клавиатуры
+        self.recorder = None  # Запись событий ввода
+        self.profiler = FrameProfiler()
+        self.hud_font = None
+        self.layers_font = None  # Шрифт названий слоев на панели инструментов
+        self.hud_surface = None  # Панель производительности поверх окна
+        self.hud_rect = None
+        self.hud_counter = 0
         self.down_scroll_bar_active = False
         self.down_scroll_bar_draw = False
         self.right_scroll_bar_active = False
         self.right_scroll_bar_draw = False
         self.saving_button = None
-        self.last_surface = None
+        self.last_export = None  # Время и пиковая память последнего сохранения
+        self.export_worker = ExportWorker()
+        self.exports_in_progress = {"save_jpg": 0, "save_png": 0}
+        self.image_dir = os.path.join("..", "saved_images")
+        self.import_worker = ImportWorker()
+        self.backdrop = None  # Фоновое изображение под слоями
+        self.importing = None  # Путь к загружаемому изображению
+        # Путь проекта без номера, от которого считаются нумерованные копии
+        self.project_path = os.path.join("..", "saved_projects", "drawing.mypaint")
+        self.project = ProjectFile(self.project_path)
+        # Журнал автосохранения, запускается в основном цикле программы
+        self.autosave = Autosave(
+            os.path.join("..", "saved_projects", "autosave.mypaint")
+        )
         self.last_pos = None
         self.brush_color = Color.BLACK
-        self.surfaces = []  # Список для хранения поверхностей
+        self.fill_tolerance = 0  # Допустимое отличие каналов цвета при заливке
+        self.history = History(self.history_limit)
+        self.stroke_rect = None  # Область текущего штриха на листе
+        self.stroke_cells = []  # Клетки текущего штриха
+        self.erased_strokes = {}  # Копии штрихов до текущего прохода ластика
+        # Слои со штрихами и сведенными изображениями в масштабе клеток
+        # и кэши наложения слоев под активным и над ним
+        self.layers = LayerStack(self.grid_size)
+        self.pipette_color = None  # Цвет под курсором для предпросмотра пипетки
+        self.pipette_rect = None
+
+        # Области экрана, требующие перерисовки в следующем кадре
+        self.dirty_rects = []
+        self.full_redraw = True
+        self.preview_rect = None  # Область текущего предпросмотра фигуры
+        self.preview_surface = None  # Фигура размером с ее область
+        # Состояние листа при последнем сохранении или открытии проекта
+        self.saved_state = self.sheet_state()
+        self.confirming = None  # Команда, ожидающая повторного нажатия
 
     def run(self):
         """
         Основной цикл программы.
-        Обрабатывает события, обновляет экран и поддерживает заданную частоту кадров.
+        Обрабатывает события, обновляет экран и поддерживает заданную частоту
+        кадров. В простое цикл не крутится вхолостую, а ждет событий.
+        При ошибке изменения листа дописываются в журнал автосохранения.
         """
+        if self.autosave.start():
+            print(
+                "Unsaved work from the last session found, press Ctrl+R to recover it"
+            )
         while True:
             try:
-                self.handle_events()
-                self.draw()
+                self.profiler.begin_frame()
+                with self.profiler.phase("handle_events"):
+                    events = self.wait_events()
+                    if self.recorder:
+                        self.recorder.record(events)
+                    self.handle_events(events)
+                with self.profiler.phase("draw"):
+                    self.draw()
+                self.profiler.end_frame(self.surfaces())
                 self.clock.tick(self.fps)
             except Exception as e:
                 print(f"Exception: {e}")
+                self.autosave.flush(self)
                 break
 
-    def handle_events(self):
+    def wait_events(self):
+        """
+        Получение событий. Если перерисовывать нечего, поток засыпает
+        до первого события или до срока, к которому что-то должно случиться
+        без участия пользователя. Завершение сохранения и загрузки изображения
+        приходит событием из фонового потока и тоже будит цикл.
+
+        Returns:
+            list: События pygame
+        """
+        timeout = self.idle_timeout()
+        if timeout is None:
+            return pygame.event.get()
+        # Нулевой таймаут в pygame.event.wait означает ожидание без срока
+        event = pygame.event.wait(max(1, math.ceil(timeout * 1000)) if timeout else 0)
+        events = [] if event.type == pygame.NOEVENT else [event]
+        return events + pygame.event.get()
+
+    def idle_timeout(self):
+        """
+        Время, которое основной цикл может ждать событий.
+
+        Returns:
+            float: Секунды до ближайшего срока, 0 - ждать без срока,
+                None - ждать нельзя: идет рисование, перетаскивание полосы
+                прокрутки, перерисовка или профилирование
+        """
+        if (
+            self.drawing
+            or self.right_scroll_bar_active
+            or self.down_scroll_bar_active
+            or self.full_redraw
+            or self.dirty_rects
+            or self.profiler.enabled
+        ):
+            return None
+        deadlines = [self.autosave.timeout(self)]
+        if self.saving_button in ("save_jpg", "save_png"):
+            deadlines.append(max(0.0, self.flash_end - time.monotonic()))
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        if not deadlines:
+            return 0
+        return min(deadlines) or None
+
+    def handle_events(self, events=None):
         """
         Обработка всех событий программы.
         Включает обработку:
@@ -158,12 +293,37 @@ class Paint:
         - Нажатия кнопок мыши
         - Движения мыши
         - Нажатия клавиш
+
+        Args:
+            events (list): События кадра, по умолчанию берутся из очереди pygame
         """
-        for event in pygame.event.get():
+        if events is None:
+            events = pygame.event.get()
+        for event in self.coalesce_motion(events):
             if event.type == pygame.QUIT:
+                # Дождаться записи уже запущенных сохранений
+                self.export_worker.wait()
+                self.autosave.close()
+                if self.recorder:
+                    self.recorder.save(self.layers)
+                    print(f"Events recorded: {self.recorder.path}")
                 exit()
 
+            if event.type == ExportWorker.EXPORT_DONE:
+                self.finish_saving(event.dict)
+
+            if event.type == ImportWorker.IMPORT_DONE:
+                self.finish_import(event.dict)
+
+            if event.type == pygame.DROPFILE:
+                self.import_image(event.file)
+
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.mark_dirty()
+
             if event.type == pygame.VIDEORESIZE:
+                self.mark_dirty()
+                self.toolbar = None
                 self.WIDTH, self.HEIGHT = event.w, event.h
                 OLD_WIDTH, OLD_HEIGHT = self.WIDTH, self.HEIGHT
                 self.sc = pygame.display.set_mode((self.WIDTH, self.HEIGHT), self.flags)
@@ -188,15 +348,62 @@ class Paint:
                     self.scale_changing(2, event.button)
 
             if event.type == pygame.MOUSEMOTION:
-                self.handle_mouse_motion(event.pos)
+                self.handle_mouse_motion(event.path)
 
             if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
                 self.handle_mouse_button_up()
 
+            # Состояние Shift берется из событий, а не из pygame.key.get_pressed,
+            # чтобы записанные события воспроизводились одинаково
+            if event.type == pygame.WINDOWFOCUSLOST:
+                self.shift_keys.clear()
+            if event.type == pygame.KEYUP:
+                self.shift_keys.discard(event.key)
+
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_z:
-                    if self.surfaces:
-                        self.surfaces.pop()
+                ctrl = event.mod & pygame.KMOD_CTRL
+                if event.key in (pygame.K_LSHIFT, pygame.K_RSHIFT):
+                    self.shift_keys.add(event.key)
+                elif event.key == pygame.K_z:
+                    self.undo()
+                elif event.key == pygame.K_y:
+                    self.redo()
+                elif event.key == pygame.K_s and ctrl:
+                    self.save_project()
+                elif event.key == pygame.K_o and ctrl:
+                    if self.confirm("Ctrl+O"):
+                        self.open_project()
+                elif event.key == pygame.K_r and ctrl:
+                    if self.confirm("Ctrl+R"):
+                        self.recover_autosave()
+                elif event.key == pygame.K_F3:
+                    self.toggle_profiler()
+                elif event.key == pygame.K_F4:
+                    self.export_profile()
+                elif event.key == pygame.K_LEFTBRACKET:
+                    self.change_fill_tolerance(-8)
+                elif event.key == pygame.K_RIGHTBRACKET:
+                    self.change_fill_tolerance(8)
+                elif event.key == pygame.K_n:
+                    self.add_layer()
+                elif event.key == pygame.K_DELETE:
+                    self.remove_layer()
+                elif event.key == pygame.K_PAGEUP:
+                    self.select_layer(1)
+                elif event.key == pygame.K_PAGEDOWN:
+                    self.select_layer(-1)
+                elif event.key == pygame.K_h:
+                    self.toggle_layer(self.layers.active, "visible")
+                elif event.key == pygame.K_l:
+                    self.toggle_layer(self.layers.active, "locked")
+                elif event.key == pygame.K_MINUS:
+                    self.change_layer_opacity(-32)
+                elif event.key == pygame.K_EQUALS:
+                    self.change_layer_opacity(32)
+
+        # Изменения листа пачками передаются в поток записи автосохранения
+        with self.profiler.phase("autosave"):
+            self.autosave.tick(self)
 
     def handle_mouse_button_down(self, pos):
         """
@@ -225,6 +432,7 @@ class Paint:
             < self.right_scroll_bar_y + self.right_scroll_bar_length
         ):
             self.right_scroll_bar_color = Color.SCROLL_BAR_ACTIVE
+            self.mark_scroll_bars_dirty()
             self.right_scroll_bar_active = True
             self.right_scroll_bar_shift = y - self.right_scroll_bar_y
 
@@ -239,33 +447,37 @@ class Paint:
             < self.down_scroll_bar_y + self.scroll_bar_width
         ):
             self.down_scroll_bar_color = Color.SCROLL_BAR_ACTIVE
+            self.mark_scroll_bars_dirty()
             self.down_scroll_bar_active = True
             self.down_scroll_bar_shift = x - self.down_scroll_bar_x
 
         # Нажатие на рабочую область рисования
         elif 0 <= x <= self.WIDTH - 20 and 100 <= y <= self.HEIGHT - 20:
             if self.tool == "pipette":
-                # Поиск цвета под курсором на всех поверхностях
-                for surface in self.surfaces[::-1]:
-                    color = surface.get_at(self.shift(pos))
-                    if color[3] > 0:  # Проверка на прозрачность
-                        self.brush_color = color
-                        break
+                color = self.sample_color(pos)
+                if color:
+                    self.brush_color = color
+                    self.mark_dirty(self.COLOR_RECT)
+            elif not self.layers.active.editable():
+                print(f"Layer is hidden or locked: {self.layers.active.name}")
+            elif self.tool == "fill":
+                with self.profiler.phase("fill"):
+                    self.fill_area(pos)
             else:
                 self.drawing = True
-                self.last_surface = pygame.Surface(
-                    (self.WIDTH_SHEET, self.HEIGHT_SHEET), pygame.SRCALPHA
-                )
-                self.last_surface.fill((0, 0, 0, 0))
                 self.last_pos = pos
+                self.preview_rect = None
+                self.preview_surface = None
+                self.stroke_rect = None
+                self.stroke_cells = []
                 if self.tool == "pencil":
-                    pygame.draw.rect(
-                        self.last_surface,
-                        self.brush_color,
-                        (*self.shift(self.last_pos), self.size, self.size),
-                    )
+                    # Карандаш, как и ластик, рисует сразу на изображении слоя
+                    cells = self.polyline_cells([self.last_pos])
+                    self.layers.active.canvas.fill(cells, self.brush_color, self.size)
+                    self.stroke_cells.append(cells)
+                    self.extend_stroke_rect(self.stamps_rect(cells))
                 elif self.tool == "eraser":
-                    self.eraser_tool(pos)
+                    self.eraser_tool([pos])
                 elif any(self.tool in row for row in self.figure_selection):
                     self.start_pos = pos
 
@@ -312,50 +524,85 @@ class Paint:
             and self.coors["save_jpg"][2] <= y <= self.coors["save_jpg"][3]
         ):
             self.saving_image("jpg")
-            self.saving_button = "save_jpg"
         # Сохранение в формате .png
         elif (
             self.coors["save_png"][0] <= x <= self.coors["save_png"][1]
             and self.coors["save_png"][2] <= y <= self.coors["save_png"][3]
         ):
             self.saving_image("png")
-            self.saving_button = "save_png"
+        # Панель слоев
+        elif (
+            self.coors["layers"][0] <= x <= self.coors["layers"][1]
+            and self.coors["layers"][2] <= y <= self.coors["layers"][3]
+        ):
+            self.click_layers(pos)
 
-    def handle_mouse_motion(self, pos):
+    def coalesce_motion(self, events):
         """
-        Обработка движения мыши.
+        Объединение идущих подряд событий движения мыши в одно событие.
+        Порядок относительно остальных событий сохраняется.
 
         Args:
-            pos (tuple): Координаты курсора мыши (x, y)
+            events (list): События кадра
+
+        Returns:
+            list: События, где каждая серия движений заменена событием
+                MOUSEMOTION с атрибутом path - всеми точками серии
+        """
+        result = []
+        for event in events:
+            if event.type != pygame.MOUSEMOTION:
+                result.append(event)
+            elif result and result[-1].type == pygame.MOUSEMOTION:
+                result[-1].path.append(event.pos)
+                result[-1].pos = event.pos
+            else:
+                result.append(
+                    pygame.event.Event(
+                        pygame.MOUSEMOTION, pos=event.pos, path=[event.pos]
+                    )
+                )
+        return result
+
+    def handle_mouse_motion(self, path):
+        """
+        Обработка движения мыши за кадр.
+        Карандаш и ластик проходят по всем точкам пути одной ломаной,
+        фигуры, пипетка и полосы прокрутки используют только последнюю точку.
+
+        Args:
+            path (list): Координаты курсора мыши (x, y) в порядке движения
 
         Обрабатывает:
         - Рисование инструментами
         - Перемещение полос прокрутки
         """
+        pos = path[-1]
         if self.drawing:
-            if self.tool == "pencil":
-                points = self.bresenham(*self.last_pos, *pos)
-                shifted_points = np.array([self.shift((px, py)) for px, py in points])
-                for px, py in shifted_points:
-                    pygame.draw.rect(
-                        self.last_surface,
-                        self.brush_color,
-                        (px, py, self.size, self.size),
-                    )
-                self.last_pos = pos
-            elif self.tool == "eraser":
-                self.eraser_tool(pos)
-            elif self.tool == "line":
-                self.draw_line(pos)
-            elif self.tool == "rectangle":
-                self.draw_rectangle(*self.start_pos, *pos)
-            elif self.tool == "arc":
-                self.draw_arc(*self.start_pos, *pos)
-            elif self.tool == "ellipse":
-                self.draw_ellipse(*self.start_pos, *pos)
+            with self.profiler.phase(self.tool):
+                if self.tool == "pencil":
+                    cells = self.polyline_cells([self.last_pos, *path])
+                    self.layers.active.canvas.fill(cells, self.brush_color, self.size)
+                    self.stroke_cells.append(cells)
+                    self.extend_stroke_rect(self.stamps_rect(cells))
+                    self.last_pos = pos
+                elif self.tool == "eraser":
+                    self.eraser_tool(path)
+                elif self.tool == "line":
+                    self.draw_line(pos)
+                elif self.tool == "rectangle":
+                    self.draw_rectangle(*self.start_pos, *pos)
+                elif self.tool == "arc":
+                    self.draw_arc(*self.start_pos, *pos)
+                elif self.tool == "ellipse":
+                    self.draw_ellipse(*self.start_pos, *pos)
+        elif self.tool == "pipette":
+            self.pipette_preview(pos)
 
         # Движение правого скроллбара
         if self.right_scroll_bar_draw and self.right_scroll_bar_active:
+            # Смещение листа меняет все изображение рабочей области
+            self.mark_dirty()
             self.right_scroll_bar_y = pos[1] - self.right_scroll_bar_shift
             self.right_scroll_bar_max_y = (
                 self.HEIGHT - self.right_scroll_bar_length - 20
@@ -371,8 +618,8 @@ class Paint:
             # Ограничение границ рабочей области рисования по Y
             if self.sheet_offset_y <= 0:
                 self.sheet_offset_y = 0
-            if self.sheet_offset_y >= self.HEIGHT - 140:
-                self.sheet_offset_y = self.HEIGHT - 140
+            if self.sheet_offset_y >= self.HEIGHT_SHEET - (self.HEIGHT - 140):
+                self.sheet_offset_y = self.HEIGHT_SHEET - (self.HEIGHT - 140)
 
             # Ограничение границ правого скроллбара
             if self.right_scroll_bar_y <= 120:
@@ -382,6 +629,7 @@ class Paint:
 
         # Движение нижнего скроллбара
         if self.down_scroll_bar_draw and self.down_scroll_bar_active:
+            self.mark_dirty()
             self.down_scroll_bar_x = pos[0] - self.down_scroll_bar_shift
             self.down_scroll_bar_max_x = self.WIDTH - self.down_scroll_bar_length - 20
             self.sheet_offset_x = int(
@@ -395,8 +643,8 @@ class Paint:
             # Ограничение границ рабочей области рисования по X
             if self.sheet_offset_x <= 0:
                 self.sheet_offset_x = 0
-            if self.sheet_offset_x >= self.WIDTH - 40:
-                self.sheet_offset_x = self.WIDTH - 40
+            if self.sheet_offset_x >= self.WIDTH_SHEET - (self.WIDTH - 40):
+                self.sheet_offset_x = self.WIDTH_SHEET - (self.WIDTH - 40)
 
             # Ограничение границ нижнего скроллбара
             if self.down_scroll_bar_x <= 20:
@@ -411,18 +659,54 @@ class Paint:
         """
         if self.drawing:
             self.drawing = False
-            self.surfaces.append(self.last_surface)
+            with self.profiler.phase("commit"):
+                if self.tool == "eraser":
+                    self.commit_erase()
+                else:
+                    self.commit_stroke()
             self.last_pos = None  # Сброс последней позиции
+            self.preview_surface = None
+            if self.preview_rect:
+                # Стереть предпросмотр, даже если штрих оказался вне листа
+                self.mark_sheet_dirty(self.preview_rect)
+                self.preview_rect = None
         if self.right_scroll_bar_active:
             self.right_scroll_bar_active = False
             self.right_scroll_bar_color = Color.SCROLL_BAR_NOT_ACTIVE
+            self.mark_scroll_bars_dirty()
         if self.down_scroll_bar_active:
             self.down_scroll_bar_active = False
             self.down_scroll_bar_color = Color.SCROLL_BAR_NOT_ACTIVE
+            self.mark_scroll_bars_dirty()
 
     def draw(self):
         """
         Отрисовка всех элементов интерфейса.
+        Перерисовываются только помеченные области экрана, которые затем
+        передаются в pygame.display.update. Если изменений нет, кадр пропускается.
+        """
+        if self.profiler.enabled:
+            self.update_hud()
+        rects = self.take_dirty_rects()
+        if rects:
+            with self.profiler.phase("active_button"):
+                self.update_toolbar()
+            with self.profiler.phase("scroll_bar"):
+                self.scroll_bar()
+
+            with self.profiler.phase("compose"):
+                for rect in rects:
+                    self.sc.set_clip(rect)
+                    self.draw_region()
+                self.sc.set_clip(None)
+            with self.profiler.phase("display_update"):
+                pygame.display.update(rects)
+
+        self.update_saving_button()
+
+    def draw_region(self):
+        """
+        Отрисовка кадра в пределах текущей области отсечения экрана.
         Включает:
         - Рабочую область
         - Нарисованные элементы
@@ -432,81 +716,247 @@ class Paint:
         """
         self.sc.fill(Color.BACK)
 
-        # Создание рабочей области
-        self.sheet = pygame.Surface((self.WIDTH_SHEET, self.HEIGHT_SHEET))
-        self.sheet.fill(Color.WHITE)
-        self.sc.blit(
-            self.sheet,
-            (
-                self.sheet_cur_x - self.sheet_offset_x,
-                self.sheet_cur_y - self.sheet_offset_y,
-            ),
+        sheet_pos = (
+            self.sheet_cur_x - self.sheet_offset_x,
+            self.sheet_cur_y - self.sheet_offset_y,
         )
-
-        for surface in self.surfaces:
-            self.sc.blit(
-                surface,
+        self.sc.fill(Color.WHITE, (sheet_pos, (self.WIDTH_SHEET, self.HEIGHT_SHEET)))
+        if self.backdrop:
+            self.backdrop.draw(
+                self.sc, sheet_pos, (self.WIDTH_SHEET, self.HEIGHT_SHEET)
+            )
+        overlay = None
+        if self.drawing and self.preview_surface:
+            overlay = (
+                self.preview_surface,
                 (
-                    self.sheet_cur_x - self.sheet_offset_x,
-                    self.sheet_cur_y - self.sheet_offset_y,
+                    sheet_pos[0] + self.preview_rect.x,
+                    sheet_pos[1] + self.preview_rect.y,
                 ),
             )
+        self.layers.draw(self.sc, sheet_pos, self.size, overlay)
+        if self.tool == "pipette" and self.pipette_color:
+            pygame.draw.rect(self.sc, self.pipette_color, self.pipette_rect)
+            pygame.draw.rect(self.sc, Color.SCROLL_BAR_ACTIVE, self.pipette_rect, 1)
 
-        if self.drawing and self.last_surface:
-            self.sc.blit(
-                self.last_surface,
-                (
-                    self.sheet_cur_x - self.sheet_offset_x,
-                    self.sheet_cur_y - self.sheet_offset_y,
-                ),
+        # Меню
+        self.sc.blit(self.toolbar, (0, 0))
+        pygame.draw.rect(self.sc, self.brush_color, self.COLOR_RECT)
+
+        for color, rect in self.scroll_bar_rects:
+            pygame.draw.rect(self.sc, color, rect)
+
+        if self.hud_surface:
+            self.sc.blit(self.hud_surface, self.hud_rect)
+
+    def surfaces(self):
+        """
+        Поверхности pygame, которыми владеет редактор.
+
+        Returns:
+            generator: Поверхности
+        """
+        for value in vars(self).values():
+            if isinstance(value, pygame.Surface):
+                yield value
+        yield from self.layers.surfaces()
+        if self.backdrop:
+            yield from self.backdrop.surfaces()
+
+    def toggle_profiler(self):
+        """
+        Включение и выключение профилировщика кадров и панели производительности.
+        """
+        self.profiler.toggle()
+        if self.hud_rect:
+            self.mark_dirty(self.hud_rect)
+        self.hud_surface = self.hud_rect = None
+        self.hud_counter = 0
+
+    def update_hud(self):
+        """
+        Обновление панели производительности раз в полсекунды.
+        """
+        self.hud_counter += 1
+        if self.hud_counter < self.fps // 2:
+            return
+        self.hud_counter = 0
+        summary = self.profiler.summary()
+        if not summary:
+            return
+        if self.hud_font is None:
+            self.hud_font = pygame.font.Font(None, 20)
+        if self.hud_rect:
+            self.mark_dirty(self.hud_rect)
+        self.hud_surface = render_hud(summary, self.hud_font)
+        self.hud_rect = self.hud_surface.get_rect(topright=(self.WIDTH - 24, 105))
+        self.mark_dirty(self.hud_rect)
+
+    def export_profile(self):
+        """
+        Сохранение собранных профилировщиком кадров в файлы CSV и JSON.
+        """
+        if not self.profiler.frames:
+            print("Profiler has no frames, press F3 to start profiling")
+            return
+        try:
+            paths = self.profiler.export(os.path.join("..", "profiles"))
+        except OSError as e:
+            print(f"Error saving profile: {e}")
+            return
+        print(f"Profile saved: {', '.join(paths)}")
+
+    def mark_dirty(self, rect=None):
+        """
+        Пометка области экрана для перерисовки.
+
+        Args:
+            rect (pygame.Rect): Область в координатах окна, None - весь экран
+        """
+        if rect is None:
+            self.full_redraw = True
+        else:
+            self.dirty_rects.append(pygame.Rect(rect))
+
+    def mark_sheet_dirty(self, rect):
+        """
+        Пометка для перерисовки области, заданной в координатах рабочей области.
+
+        Args:
+            rect (pygame.Rect): Область в координатах рабочей области
+        """
+        self.mark_dirty(
+            pygame.Rect(rect).move(
+                self.sheet_cur_x - self.sheet_offset_x,
+                self.sheet_cur_y - self.sheet_offset_y,
             )
+        )
 
-        self.head_back = pygame.Surface((self.WIDTH, 100))
-        self.head_back.fill(Color.HEAD_BACK)
-        self.sc.blit(self.head_back, (0, 0))
+    def mark_scroll_bars_dirty(self):
+        """
+        Пометка для перерисовки полос вдоль правого и нижнего краев окна.
+        """
+        self.mark_dirty((self.WIDTH - 20, 101, 20, self.HEIGHT - 101))
+        self.mark_dirty((0, self.HEIGHT - 20, self.WIDTH, 20))
 
-        # Меню
-        self.sc.blit(self.head, (0, 0))
+    def update_preview(self, cells):
+        """
+        Отрисовка предпросмотра фигуры на поверхности размером с ее область
+        в видимой части листа и пометка для перерисовки предыдущего и нового
+        положения фигуры. Клетки фигуры становятся клетками текущего штриха.
 
-        self.active_button_surface = pygame.Surface((self.WIDTH, 100), pygame.SRCALPHA)
-        self.active_button(self.tool)
+        Args:
+            cells (numpy.ndarray): Клетки фигуры формы (N, 2)
+        """
+        if len(cells):
+            bounds = raster.cells_bounds(cells).clip(self.visible_rect())
+        else:
+            bounds = pygame.Rect(0, 0, 0, 0)
+        rect = self.sheet_rect(bounds)
+        if rect:
+            self.preview_surface = pygame.Surface(rect.size, pygame.SRCALPHA)
+            raster.stamp(
+                self.preview_surface,
+                np.asarray(cells) - bounds.topleft,
+                self.size,
+                self.brush_color,
+            )
+        else:
+            self.preview_surface = None
+        if self.preview_rect:
+            self.mark_sheet_dirty(self.preview_rect)
+        self.mark_sheet_dirty(rect)
+        self.preview_rect = rect
+        self.stroke_rect = rect
+        self.stroke_cells = [cells]
+
+    def extend_stroke_rect(self, rect):
+        """
+        Расширение области текущего штриха и ее пометка для перерисовки.
+
+        Args:
+            rect (pygame.Rect): Добавляемая область в координатах рабочей области
+        """
+        if self.stroke_rect:
+            self.stroke_rect = self.stroke_rect.union(rect)
+        else:
+            self.stroke_rect = pygame.Rect(rect)
+        self.mark_sheet_dirty(rect)
+
+    def take_dirty_rects(self):
+        """
+        Получение списка областей для перерисовки в текущем кадре.
+        Пересекающиеся области объединяются, список помеченных областей очищается.
+
+        Returns:
+            list: Список pygame.Rect в координатах окна
+        """
+        screen = self.sc.get_rect()
+        if self.full_redraw:
+            rects = [screen]
+        else:
+            rects = []
+            for rect in self.dirty_rects:
+                rect = rect.clip(screen)
+                if not rect.width or not rect.height:
+                    continue
+                i = rect.collidelist(rects)
+                while i != -1:
+                    rect.union_ip(rects.pop(i))
+                    i = rect.collidelist(rects)
+                rects.append(rect)
+        self.full_redraw = False
+        self.dirty_rects = []
+        return rects
+
+    def stamps_rect(self, cells):
+        """
+        Ограничивающий прямоугольник отпечатков кисти в заданных клетках.
+
+        Args:
+            cells (numpy.ndarray): Клетки формы (N, 2)
+
+        Returns:
+            pygame.Rect: Прямоугольник в координатах рабочей области
+        """
+        return self.sheet_rect(raster.cells_bounds(cells))
+
+    def button_rect(self, name):
+        """
+        Прямоугольник кнопки меню.
 
-        pygame.draw.rect(self.sc, self.brush_color, (309, 59, 24, 24))
-        pygame.draw.rect(self.sc, Color.SCROLL_BAR_NOT_ACTIVE, (0, 100, self.WIDTH, 1))
+        Args:
+            name (str): Название кнопки из self.coors
 
-        self.scroll_bar()
-        pygame.display.flip()
+        Returns:
+            pygame.Rect: Прямоугольник кнопки в координатах окна
+        """
+        x1, x2, y1, y2 = self.coors[name]
+        return pygame.Rect(x1, y1, x2 - x1 + 1, y2 - y1 + 1)
 
     def scroll_bar(self):
         """
-        Отрисовка полос прокрутки.
-        Отображает вертикальную и горизонтальную полосы прокрутки,
+        Подготовка прямоугольников полос прокрутки: поля вдоль правого
+        и нижнего краев окна, вертикальная и горизонтальная полосы прокрутки,
         если размер рабочей области превышает размер окна.
         """
-        self.scroll_bar_surface = pygame.Surface(
-            (self.WIDTH, self.HEIGHT), pygame.SRCALPHA
-        )
-        self.scroll_bar_surface.fill((0, 0, 0, 0))
-        pygame.draw.rect(
-            self.scroll_bar_surface, Color.BACK, (0, self.HEIGHT - 20, self.WIDTH, 20)
-        )
-        pygame.draw.rect(
-            self.scroll_bar_surface,
-            Color.BACK,
-            (self.WIDTH - 20, 101, 20, self.HEIGHT - 101),
-        )
+        self.scroll_bar_rects = [
+            (Color.BACK, (0, self.HEIGHT - 20, self.WIDTH, 20)),
+            (Color.BACK, (self.WIDTH - 20, 101, 20, self.HEIGHT - 101)),
+        ]
 
         # Координаты правого скроллбара и его отображение
         if self.HEIGHT_SHEET > self.HEIGHT:
-            pygame.draw.rect(
-                self.scroll_bar_surface,
-                self.right_scroll_bar_color,
+            self.scroll_bar_rects.append(
                 (
-                    self.right_scroll_bar_x,
-                    self.right_scroll_bar_y,
-                    self.scroll_bar_width,
-                    self.right_scroll_bar_length,
-                ),
+                    self.right_scroll_bar_color,
+                    (
+                        self.right_scroll_bar_x,
+                        self.right_scroll_bar_y,
+                        self.scroll_bar_width,
+                        self.right_scroll_bar_length,
+                    ),
+                )
             )
             self.right_scroll_bar_draw = True
         else:
@@ -516,15 +966,16 @@ class Paint:
 
         # Координаты нижнего скроллбара и его отображение
         if self.WIDTH_SHEET > self.WIDTH:
-            pygame.draw.rect(
-                self.scroll_bar_surface,
-                self.down_scroll_bar_color,
+            self.scroll_bar_rects.append(
                 (
-                    self.down_scroll_bar_x,
-                    self.down_scroll_bar_y,
-                    self.down_scroll_bar_length,
-                    self.scroll_bar_width,
-                ),
+                    self.down_scroll_bar_color,
+                    (
+                        self.down_scroll_bar_x,
+                        self.down_scroll_bar_y,
+                        self.down_scroll_bar_length,
+                        self.scroll_bar_width,
+                    ),
+                )
             )
             self.down_scroll_bar_draw = True
         else:
@@ -532,8 +983,6 @@ class Paint:
             self.sheet_offset_x = 0
             self.down_scroll_bar_x = 20
 
-        self.sc.blit(self.scroll_bar_surface, (0, 0))
-
     def shift(self, coors):
         """
         Преобразование координат окна в координаты рабочей области.
@@ -549,6 +998,52 @@ class Paint:
         y = int((y - (self.sheet_cur_y - self.sheet_offset_y)) // self.size * self.size)
         return (x, y)
 
+    def to_cells(self, points):
+        """
+        Векторное преобразование координат окна в клетки сетки кисти.
+        Соответствует self.shift, но сразу для всего массива точек.
+
+        Args:
+            points (numpy.ndarray): Массив точек (x, y) в координатах окна
+
+        Returns:
+            numpy.ndarray: Массив клеток формы (N, 2)
+        """
+        origin = (
+            self.sheet_cur_x - self.sheet_offset_x,
+            self.sheet_cur_y - self.sheet_offset_y,
+        )
+        points = np.asarray(points).reshape(-1, 2)
+        return (np.floor(points) - origin).astype(np.int64) // self.size
+
+    def polyline_cells(self, points):
+        """
+        Клетки сетки кисти, через которые проходит ломаная.
+
+        Args:
+            points (list): Вершины ломаной (x, y) в координатах окна
+
+        Returns:
+            numpy.ndarray: Массив уникальных клеток формы (N, 2)
+        """
+        return raster.unique_cells(self.to_cells(raster.polyline(points)))
+
+    def to_grid(self, point):
+        """
+        Перевод координат окна в дробные координаты сетки кисти,
+        где клетка (i, j) занимает квадрат [i, i + 1) x [j, j + 1).
+
+        Args:
+            point (tuple): Координаты окна (x, y)
+
+        Returns:
+            tuple: Координаты в клетках
+        """
+        return (
+            (point[0] - self.sheet_cur_x + self.sheet_offset_x) / self.size,
+            (point[1] - self.sheet_cur_y + self.sheet_offset_y) / self.size,
+        )
+
     def change_color(self, pos):
         """
         Изменение текущего цвета кисти.
@@ -561,6 +1056,7 @@ class Paint:
         j = (y - 13) // 24
         if 0 <= i <= 5 and 0 <= j <= 2:
             self.brush_color = Color.colors[j, i]
+            self.mark_dirty(self.COLOR_RECT)
 
     def change_tool(self, pos):
         """
@@ -576,6 +1072,7 @@ class Paint:
             self.change_tool_x = a
             self.change_tool_y = b
             self.tool = self.figure_selection[self.change_tool_y, self.change_tool_x]
+            self.mark_dirty((0, 0, self.WIDTH, 100))
 
     def scale_changing(self, scale, button):
         """
@@ -586,26 +1083,419 @@ class Paint:
             button (int): Номер кнопки мыши (4 - колесико вверх, 5 - колесико вниз)
         """
         if button == 4 or button == 5:
-            self.WIDTH_SHEET //= scale
-            self.HEIGHT_SHEET //= scale
-            self.size //= scale
-            if self.WIDTH_SHEET <= 240:
-                self.WIDTH_SHEET = 240
-                self.HEIGHT_SHEET = 165
-                self.size = 3
-            if self.WIDTH_SHEET >= 1920:
-                self.WIDTH_SHEET = 1920
-                self.HEIGHT_SHEET = 1320
-                self.size = 24
-
-            for i in range(len(self.surfaces)):
-                self.surfaces[i] = pygame.transform.scale(
-                    self.surfaces[i], (self.WIDTH_SHEET, self.HEIGHT_SHEET)
+            self.mark_dirty()
+            old_size = self.size
+            self.size = min(max(int(self.size // scale), 3), 24)
+            self.WIDTH_SHEET = self.grid_size[0] * self.size
+            self.HEIGHT_SHEET = self.grid_size[1] * self.size
+            if self.backdrop:
+                self.backdrop.request(
+                    self.import_worker, (self.WIDTH_SHEET, self.HEIGHT_SHEET)
+                )
+
+            if self.stroke_rect:
+                self.stroke_rect = self.sheet_rect(
+                    self.cells_rect(self.stroke_rect, old_size)
                 )
-            if self.last_surface:
-                self.last_surface = pygame.transform.scale(
-                    self.last_surface, (self.WIDTH_SHEET, self.HEIGHT_SHEET)
+            if self.preview_surface:
+                self.update_preview(self.stroke_cells[0])
+
+    def visible_rect(self):
+        """
+        Часть листа, видимая в рабочей области окна.
+
+        Returns:
+            pygame.Rect: Прямоугольник в клетках
+        """
+        view = pygame.Rect(0, 101, self.WIDTH - 20, self.HEIGHT - 121).move(
+            self.sheet_offset_x - self.sheet_cur_x,
+            self.sheet_offset_y - self.sheet_cur_y,
+        )
+        return self.cells_rect(view).clip(self.grid_rect())
+
+    def grid_rect(self):
+        """
+        Прямоугольник всего листа в клетках сетки кисти.
+
+        Returns:
+            pygame.Rect: Прямоугольник листа в клетках
+        """
+        return pygame.Rect(0, 0, *self.grid_size)
+
+    def cells_rect(self, rect, size=None):
+        """
+        Перевод прямоугольника из координат рабочей области в клетки.
+        Частично покрытые клетки включаются в результат.
+
+        Args:
+            rect (pygame.Rect): Прямоугольник в координатах рабочей области
+            size (int): Размер клетки, по умолчанию текущий размер кисти
+
+        Returns:
+            pygame.Rect: Прямоугольник в клетках
+        """
+        size = size or self.size
+        left, top = rect.left // size, rect.top // size
+        right = -(-rect.right // size)
+        bottom = -(-rect.bottom // size)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def sheet_rect(self, rect):
+        """
+        Перевод прямоугольника из клеток в координаты рабочей области.
+
+        Args:
+            rect (pygame.Rect): Прямоугольник в клетках
+
+        Returns:
+            pygame.Rect: Прямоугольник в координатах рабочей области
+        """
+        return pygame.Rect(
+            rect.x * self.size,
+            rect.y * self.size,
+            rect.w * self.size,
+            rect.h * self.size,
+        )
+
+    def commit_stroke(self):
+        """
+        Сохранение нарисованного штриха как примитива из его клеток
+        и перенос на изображение активного слоя.
+        """
+        cells, self.stroke_cells = self.stroke_cells, []
+        if not cells:
+            return
+        cells = np.concatenate(cells)
+        inside = np.all((cells >= 0) & (cells < self.grid_rect().size), axis=1)
+        cells = raster.unique_cells(cells[inside])
+        if not len(cells):
+            return
+        stroke = Stroke(self.tool, self.brush_color, cells)
+        action = AddStroke(self.layers.active, stroke)
+        action.redo(self.layers)
+        self.history.push(action)
+        if self.tool != "pencil":  # Карандаш уже нарисован на изображении слоя
+            self.layers.active.canvas.fill(cells, stroke.color, self.size)
+        self.mark_sheet_dirty(self.sheet_rect(stroke.rect))
+
+    def fill_area(self, pos):
+        """
+        Заливка связной области активного слоя, похожей по цвету на клетку
+        под курсором. Залитые клетки сохраняются как обычный штрих, поэтому
+        заливка отменяется, стирается и сохраняется в проекте как все штрихи.
+        На очень больших листах заливка ограничена видимой частью листа.
+
+        Args:
+            pos (tuple): Координаты курсора (x, y)
+        """
+        cx, cy = self.to_cells([pos])[0]
+        rect = self.grid_rect()
+        if not rect.collidepoint(cx, cy):
+            return
+        if rect.width * rect.height > self.fill_limit:
+            rect = self.visible_rect()
+        layer = self.layers.active
+        cells = layer.canvas.read(rect)
+        mask = raster.flood_fill(
+            cells, (cx - rect.left, cy - rect.top), self.fill_tolerance
+        )
+        stroke = Stroke("fill", self.brush_color, np.argwhere(mask) + rect.topleft)
+        if (cells[mask] == stroke.color).all():
+            return  # Область уже залита этим цветом
+        action = AddStroke(layer, stroke)
+        action.redo(self.layers)
+        self.history.push(action)
+        layer.canvas.fill(stroke.cells, stroke.color, self.size)
+        self.mark_sheet_dirty(self.sheet_rect(stroke.rect))
+
+    def change_fill_tolerance(self, step):
+        """
+        Изменение допуска заливки.
+
+        Args:
+            step (int): Изменение допуска
+        """
+        self.fill_tolerance = min(max(self.fill_tolerance + step, 0), 255)
+        self.mark_dirty(self.TOLERANCE_RECT)
+
+    def layers_changed(self):
+        """
+        Пересборка кэшей наложения после изменения состава, порядка
+        или свойств слоев и перерисовка листа и панели слоев.
+        """
+        self.layers.rebuild(self.size)
+        self.mark_dirty()
+
+    def add_layer(self):
+        """
+        Добавление пустого слоя над активным. Действие можно отменить.
+        """
+        if self.drawing:
+            return
+        layer = Layer(self.layers.new_name(), self.grid_size)
+        action = AddLayer(layer, self.layers.index() + 1)
+        action.redo(self.layers)
+        self.history.push(action)
+        self.layers_changed()
+        print(f"Layer added: {layer.name}")
+
+    def remove_layer(self):
+        """
+        Удаление активного слоя, если он не последний. Действие можно отменить.
+        """
+        if self.drawing or len(self.layers.layers) < 2:
+            return
+        layer = self.layers.active
+        action = RemoveLayer(layer, self.layers.index())
+        action.redo(self.layers)
+        self.history.push(action)
+        self.layers_changed()
+        print(f"Layer removed: {layer.name}")
+
+    def select_layer(self, step):
+        """
+        Выбор соседнего слоя активным.
+
+        Args:
+            step (int): 1 - слой выше, -1 - слой ниже
+        """
+        index = self.layers.index() + step
+        if self.drawing or not 0 <= index < len(self.layers.layers):
+            return
+        self.layers.select(self.layers.layers[index])
+        self.layers_changed()
+
+    def toggle_layer(self, layer, attribute):
+        """
+        Переключение видимости или блокировки слоя.
+
+        Args:
+            layer (Layer): Слой
+            attribute (str): "visible" или "locked"
+        """
+        if self.drawing:
+            return
+        setattr(layer, attribute, not getattr(layer, attribute))
+        self.layers_changed()
+        state = "on" if getattr(layer, attribute) else "off"
+        print(f"Layer {attribute}: {layer.name} {state}")
+
+    def change_layer_opacity(self, step):
+        """
+        Изменение непрозрачности активного слоя.
+
+        Args:
+            step (int): Изменение непрозрачности
+        """
+        layer = self.layers.active
+        layer.opacity = min(max(layer.opacity + step, 0), 255)
+        # Активный слой не входит в кэши наложения и рисуется с новой
+        # непрозрачностью без их пересборки
+        self.mark_dirty()
+        print(f"Layer opacity: {layer.name} {round(layer.opacity / 2.55)}%")
+
+    def layer_rows(self):
+        """
+        Строки панели слоев: не больше четырех слоев вокруг активного,
+        верхний слой листа в верхней строке.
+
+        Returns:
+            list: Пары (слой, прямоугольник строки в координатах окна)
+        """
+        x1, x2, y1, y2 = self.coors["layers"]
+        count = (y2 - y1 + 1) // 21
+        layers = self.layers.layers[::-1]
+        active = layers.index(self.layers.active)
+        first = min(max(active - 1, 0), max(len(layers) - count, 0))
+        return [
+            (layer, pygame.Rect(x1, y1 + row * 21, x2 - x1 + 1, 21))
+            for row, layer in enumerate(layers[first : first + count])
+        ]
+
+    def click_layers(self, pos):
+        """
+        Обработка нажатия на панель слоев: выбор слоя, переключение
+        его видимости или блокировки.
+
+        Args:
+            pos (tuple): Координаты курсора мыши (x, y)
+        """
+        for layer, rect in self.layer_rows():
+            if not rect.collidepoint(pos):
+                continue
+            if pos[0] < rect.x + 20:
+                self.toggle_layer(layer, "visible")
+            elif pos[0] < rect.x + 38:
+                self.toggle_layer(layer, "locked")
+            elif layer is not self.layers.active and not self.drawing:
+                self.layers.select(layer)
+                self.layers_changed()
+            return
+
+    def draw_layers_panel(self):
+        """
+        Рисование панели слоев на панели инструментов: флажки видимости
+        и блокировки, название и непрозрачность каждого слоя.
+        """
+        if self.layers_font is None:
+            self.layers_font = pygame.font.Font(None, 18)
+        for layer, rect in self.layer_rows():
+            if layer is self.layers.active:
+                pygame.draw.rect(
+                    self.active_button_surface, (*Color.colors[1][0], 50), rect
                 )
+            for shift, checked in ((4, layer.visible), (22, layer.locked)):
+                box = pygame.Rect(rect.x + shift, rect.y + 4, 13, 13)
+                pygame.draw.rect(self.toolbar, Color.ICON, box, 1)
+                if checked:
+                    pygame.draw.rect(
+                        self.toolbar, Color.SCROLL_BAR_ACTIVE, box.inflate(-6, -6)
+                    )
+            for text, place in (
+                (layer.name, {"midleft": (rect.x + 42, rect.centery)}),
+                (
+                    f"{round(layer.opacity / 2.55)}%",
+                    {"midright": (rect.right - 4, rect.centery)},
+                ),
+            ):
+                label = self.layers_font.render(text, True, Color.SCROLL_BAR_ACTIVE)
+                self.toolbar.blit(label, label.get_rect(**place))
+
+    def draw_fill_tolerance(self):
+        """
+        Рисование допуска заливки под значком заливки на панели инструментов.
+        """
+        label = self.layers_font.render(
+            str(self.fill_tolerance), True, Color.SCROLL_BAR_ACTIVE
+        )
+        self.toolbar.blit(label, label.get_rect(center=self.TOLERANCE_RECT.center))
+
+    def commit_erase(self):
+        """
+        Сохранение прохода ластика в историю: для каждого затронутого штриха
+        запоминаются только фрагменты маски стирания внутри области прохода.
+        Штрихи, у которых не исчезло ни одной клетки, не сохраняются.
+        """
+        erased, self.erased_strokes = self.erased_strokes, {}
+        if not self.stroke_rect:
+            return
+        rect = self.cells_rect(self.stroke_rect)
+        patches = []
+        for stroke, before in erased.items():
+            area = stroke.rect.clip(rect).move(-stroke.rect.x, -stroke.rect.y)
+            xs = slice(area.left, area.right)
+            ys = slice(area.top, area.bottom)
+            after = stroke.erased[xs, ys]
+            before = before[xs, ys] if before is not None else np.zeros_like(after)
+            if not (stroke.mask()[xs, ys] & after & ~before).any():
+                stroke.erased[xs, ys] = before
+                continue
+            patches.append((stroke, area, before, after.copy()))
+        if patches:
+            self.history.push(EraseStrokes(self.layers.active, rect, patches))
+
+    def undo(self):
+        """
+        Отмена последнего действия. Во время рисования не выполняется:
+        текущий штрих еще не в истории, и пересборка слоя стерла бы его клетки.
+        """
+        if not self.drawing:
+            self.apply_history(self.history.undo(self.layers))
+
+    def redo(self):
+        """
+        Повтор отмененного действия. Во время рисования не выполняется.
+        """
+        if not self.drawing:
+            self.apply_history(self.history.redo(self.layers))
+
+    def apply_history(self, result):
+        """
+        Обновление листа после отмены или повтора действия.
+
+        Args:
+            result (tuple): Измененный слой и область в клетках или None.
+                Слой None означает изменение состава слоев
+        """
+        if result is None:
+            return
+        layer, rect = result
+        if layer is None:
+            self.layers_changed()
+        else:
+            self.redraw_canvas_region(rect, layer)
+
+    def redraw_canvas_region(self, rect, layer=None):
+        """
+        Пересборка области изображения слоя из штрихов, которые ее пересекают,
+        и кэша наложения, в который входит слой.
+
+        Args:
+            rect (pygame.Rect): Область в клетках, None - ничего не делать
+            layer (Layer): Слой, по умолчанию активный
+        """
+        if rect is None:
+            return
+        rect = rect.clip(self.grid_rect())
+        if not rect.width or not rect.height:
+            return
+        layer = layer or self.layers.active
+        canvas = layer.canvas
+        # Пересобираются только плитки, где есть изображение или штрихи
+        keys = {key for key in canvas.tiles if canvas.tile_rect(key).colliderect(rect)}
+        for stroke in layer.strokes.query(rect):
+            keys.update(canvas.keys(stroke.rect.clip(rect)))
+        for key in keys:
+            area = canvas.tile_rect(key).clip(rect)
+            cells = np.zeros((area.width, area.height, 4), dtype=np.uint8)
+            for stroke in layer.strokes.query(area):
+                local = stroke.visible_cells() - area.topleft
+                inside = np.all((local >= 0) & (local < area.size), axis=1)
+                cells[local[inside, 0], local[inside, 1]] = stroke.color
+            canvas.write(area, cells, self.size)
+        self.layers.changed(layer, rect, self.size)
+        self.mark_sheet_dirty(self.sheet_rect(rect))
+
+    def sample_color(self, pos):
+        """
+        Чтение цвета наложения видимых слоев под курсором, а где слои
+        прозрачны - цвета фонового изображения.
+
+        Args:
+            pos (tuple): Координаты курсора (x, y)
+
+        Returns:
+            pygame.Color: Непрозрачный цвет клетки или None, если клетка пуста
+                или вне листа
+        """
+        cx, cy = self.to_cells([pos])[0]
+        if not self.grid_rect().collidepoint(cx, cy):
+            return None
+        color = self.layers.get(cx, cy)
+        if color[3] == 0 and self.backdrop:
+            point = (
+                pos[0] - self.sheet_cur_x + self.sheet_offset_x,
+                pos[1] - self.sheet_cur_y + self.sheet_offset_y,
+            )
+            color = self.backdrop.get(point, (self.WIDTH_SHEET, self.HEIGHT_SHEET))
+        if color is None or color[3] == 0:  # Проверка на прозрачность
+            return None
+        # Строка массива numpy переводится в целые числа Python, а альфа
+        # отбрасывается: кисть рисует непрозрачным цветом
+        return pygame.Color(*(int(c) for c in color[:3]))
+
+    def pipette_preview(self, pos):
+        """
+        Обновление образца цвета рядом с курсором при выбранной пипетке.
+
+        Args:
+            pos (tuple): Координаты курсора (x, y)
+        """
+        if self.pipette_rect:
+            self.mark_dirty(self.pipette_rect)
+        self.pipette_color = self.sample_color(pos)
+        self.pipette_rect = pygame.Rect(pos[0] + 12, pos[1] + 12, 20, 20)
+        self.mark_dirty(self.pipette_rect)
 
     def tools(self, tool):
         """
@@ -616,6 +1506,10 @@ class Paint:
         """
         if tool in ("pencil", "eraser", "pipette"):
             self.tool = tool
+        self.mark_dirty((0, 0, self.WIDTH, 100))
+        if self.pipette_rect:
+            self.mark_dirty(self.pipette_rect)
+            self.pipette_color = self.pipette_rect = None
         if self.eraser and (tool == "pencil" or tool == "figure_selection"):
             self.brush_color = self.last_color
             self.eraser = False
@@ -625,19 +1519,91 @@ class Paint:
             self.last_color = self.brush_color
             self.brush_color = Color.HEAD_BACK
 
-    def eraser_tool(self, pos):
+    def eraser_tool(self, path):
         """
         Реализация инструмента ластика.
 
         Args:
-            pos (tuple): Текущие координаты курсора (x, y)
+            path (list): Координаты курсора (x, y) с прошлого вызова
+        """
+        cells = self.polyline_cells([self.last_pos, *path])
+        cells_rect = raster.cells_bounds(cells)
+
+        # Стираются только штрихи активного слоя из ячеек индекса,
+        # через которые прошел ластик
+        layer = self.layers.active
+        for stroke in layer.strokes.query_cells(cells):
+            if not stroke.rect.colliderect(cells_rect):
+                continue
+            local = cells - stroke.rect.topleft
+            inside = np.all((local >= 0) & (local < stroke.rect.size), axis=1)
+            if not inside.any():
+                continue
+            if stroke not in self.erased_strokes:
+                self.erased_strokes[stroke] = (
+                    None if stroke.erased is None else stroke.erased.copy()
+                )
+            stroke.erase(local[inside])
+
+        # Стирание сразу и на изображении слоя, чтобы не пересобирать его
+        layer.canvas.fill(cells, (0, 0, 0, 0), self.size)
+        self.extend_stroke_rect(self.sheet_rect(cells_rect))
+        self.last_pos = path[-1]
+
+    def draw_fill_icon(self):
         """
-        points = self.bresenham(*self.last_pos, *pos)
-        shifted_points = np.array([self.shift((px, py)) for px, py in points])
-        for px, py in shifted_points:
-            for surface in self.surfaces:
-                pygame.draw.rect(surface, (0, 0, 0, 0), (px, py, self.size, self.size))
-        self.last_pos = pos
+        Рисование значка заливки в ячейке выбора фигур на изображении меню.
+        """
+        b, a = np.argwhere(self.figure_selection == "fill")[0]
+        x = self.coors["figure_selection"][0] + a * 24
+        y = self.coors["figure_selection"][2] + b * 24
+        # Наклоненное ведро и капля краски
+        pygame.draw.polygon(
+            self.head,
+            Color.ICON,
+            [(x + 5, y + 11), (x + 12, y + 4), (x + 19, y + 11), (x + 12, y + 18)],
+            2,
+        )
+        pygame.draw.line(self.head, Color.ICON, (x + 5, y + 11), (x + 19, y + 11), 2)
+        pygame.draw.circle(self.head, Color.ICON, (x + 20, y + 17), 2)
+
+    def update_toolbar(self):
+        """
+        Сборка панели инструментов: фон, изображение меню, подсветка кнопок,
+        панель слоев, допуск заливки и разделительная линия. Панель
+        собирается один раз в формате экрана и пересобирается только
+        при изменении подсветки кнопок, слоев, допуска или размера окна.
+        """
+        state = (
+            self.tool,
+            getattr(self, "change_tool_x", None),
+            getattr(self, "change_tool_y", None),
+            tuple(
+                button for button, count in self.exports_in_progress.items() if count
+            ),
+            self.saving_button,
+            self.is_saving_successful,
+            tuple(
+                (id(layer), layer.name, layer.visible, layer.locked, layer.opacity)
+                for layer, _ in self.layer_rows()
+            ),
+            id(self.layers.active),
+            self.fill_tolerance,
+        )
+        if self.toolbar is not None and state == self.toolbar_state:
+            return
+        self.toolbar_state = state
+        self.toolbar = pygame.Surface((self.WIDTH, 101), 0, self.sc)
+        self.toolbar.fill(Color.HEAD_BACK)
+        self.toolbar.blit(self.head, (0, 0))
+        self.active_button_surface = pygame.Surface((self.WIDTH, 100), pygame.SRCALPHA)
+        self.active_button(self.tool)
+        self.draw_layers_panel()
+        self.draw_fill_tolerance()
+        self.toolbar.blit(self.active_button_surface, (0, 0))
+        pygame.draw.rect(
+            self.toolbar, Color.SCROLL_BAR_NOT_ACTIVE, (0, 100, self.WIDTH, 1)
+        )
 
     def active_button(self, tool):
         """
@@ -664,6 +1630,14 @@ class Paint:
                 (*Color.colors[1][0], 50),
                 (x1, y1, x2 - x1 + 1, y2 - y1 + 1),
             )
+        # Кнопки сохранения, задания которых еще выполняются
+        for button, count in self.exports_in_progress.items():
+            if count:
+                pygame.draw.rect(
+                    self.active_button_surface,
+                    (*Color.colors[1][0], 50),
+                    self.button_rect(button),
+                )
         if self.saving_button in ("save_jpg", "save_png"):
             x1, x2, y1, y2 = self.coors[f"{self.saving_button}"]
             if self.is_saving_successful:
@@ -675,12 +1649,18 @@ class Paint:
                 (*color, 50),
                 (x1, y1, x2 - x1 + 1, y2 - y1 + 1),
             )
-            self.counter_to_save += 1
-            if self.counter_to_save == 60:
-                self.counter_to_save = 0
-                self.saving_button = None
-                self.is_saving_successful = False
-        self.sc.blit(self.active_button_surface, (0, 0))
+
+    def update_saving_button(self):
+        """
+        Снятие подсветки кнопки сохранения по истечении flash_time.
+        """
+        if (
+            self.saving_button in ("save_jpg", "save_png")
+            and time.monotonic() >= self.flash_end
+        ):
+            self.mark_dirty(self.button_rect(self.saving_button))
+            self.saving_button = None
+            self.is_saving_successful = False
 
     def draw_line(self, pos):
         """
@@ -689,15 +1669,8 @@ class Paint:
         Args:
             pos (tuple): Текущие координаты курсора (x, y)
         """
-        self.last_surface.fill((0, 0, 0, 0))
-        points = self.bresenham(*self.start_pos, *pos)
-
-        shifted_points = np.array([self.shift((px, py)) for px, py in points])
-
-        for px, py in shifted_points:
-            pygame.draw.rect(
-                self.last_surface, self.brush_color, (px, py, self.size, self.size)
-            )
+        cells = self.polyline_cells([self.start_pos, pos])
+        self.update_preview(cells)
 
     def draw_rectangle(self, x1, y1, x2, y2):
         """
@@ -709,17 +1682,13 @@ class Paint:
             x2 (int): Конечная x-координата
             y2 (int): Конечная y-координата
         """
-        self.last_surface.fill((0, 0, 0, 0))
-
-        x1, y1 = self.shift((x1, y1))
-        x2, y2 = self.shift((x2, y2))
+        (x1, y1), (x2, y2) = self.to_cells([(x1, y1), (x2, y2)])
 
-        width = x2 - x1 - abs((x2 - x1) % self.size)
-        height = y2 - y1 - abs((y2 - y1) % self.size)
+        width = x2 - x1
+        height = y2 - y1
 
         # Проверка нажатия Shift для рисования квадрата
-        keys = pygame.key.get_pressed()
-        is_shift_pressed = keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]
+        is_shift_pressed = bool(self.shift_keys)
 
         if is_shift_pressed:
             width = min(abs(width), abs(height))
@@ -736,14 +1705,8 @@ class Paint:
             (x1, y1),
         ]
 
-        for i in range(len(points) - 1):
-            start = points[i]
-            end = points[i + 1]
-            line_points = self.bresenham(*start, *end)
-            for point in line_points:
-                pygame.draw.rect(
-                    self.last_surface, self.brush_color, (*point, self.size, self.size)
-                )
+        cells = raster.unique_cells(raster.polyline(points))
+        self.update_preview(cells)
 
     def draw_arc(self, x1, y1, x2, y2):
         """
@@ -755,15 +1718,13 @@ class Paint:
             x2 (int): Конечная x-координата
             y2 (int): Конечная y-координата
         """
-        self.last_surface.fill((0, 0, 0, 0))
         # Расчет радиуса и центра дуги
         radius = int(math.hypot(x2 - x1, y2 - y1) / 2)
         xc = int((x1 + x2) / 2)
         yc = int((y1 + y2) / 2)
 
         # Проверка нажатия Shift для изменения направления дуги
-        keys = pygame.key.get_pressed()
-        is_shift_pressed = keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]
+        is_shift_pressed = bool(self.shift_keys)
 
         theta_start = math.atan2(y1 - yc, x1 - xc)
         theta_end = math.atan2(y2 - yc, x2 - xc)
@@ -776,19 +1737,14 @@ class Paint:
         if theta_end < theta_start:
             theta_end += 2 * math.pi
 
-        # Алгоритм для рисования дуги
-        theta = np.arange(theta_start, theta_end, 0.01)
-        x = (xc + radius * np.cos(theta)).astype(int)
-        y = (yc + radius * np.sin(theta)).astype(int)
-
-        # Создание массива точек и их смещение
-        points = np.column_stack((x, y))
-        shifted_points = np.array([self.shift((px, py)) for px, py in points])
-
-        for px, py in shifted_points:
-            pygame.draw.rect(
-                self.last_surface, self.brush_color, (px, py, self.size, self.size)
-            )
+        cells = raster.arc_cells(
+            self.to_grid((xc, yc)),
+            radius / self.size,
+            theta_start,
+            theta_end,
+            self.grid_rect(),
+        )
+        self.update_preview(cells)
 
     def draw_ellipse(self, x1, y1, x2, y2):
         """
@@ -800,13 +1756,10 @@ class Paint:
             x2 (int): Конечная x-координата
             y2 (int): Конечная y-координата
         """
-        self.last_surface.fill((0, 0, 0, 0))
-
         a = int(abs((x2 - x1) / 2))
         b = int(abs((y2 - y1) / 2))
 
-        keys = pygame.key.get_pressed()
-        is_shift_pressed = keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]
+        is_shift_pressed = bool(self.shift_keys)
 
         if is_shift_pressed:
             a = b = min(a, b)
@@ -816,102 +1769,242 @@ class Paint:
 
         xc = int(x1 + a)
         yc = int(y1 + b)
-        # Алгоритм для рисования эллипса
-        angles = np.arange(0, 360)
-        rad = np.radians(angles)
-        x = (a * np.cos(rad)).astype(int)
-        y = (b * np.sin(rad)).astype(int)
+        cells = raster.ellipse_cells(
+            self.to_grid((xc, yc)), (a / self.size, b / self.size), self.grid_rect()
+        )
+        self.update_preview(cells)
 
-        points = np.column_stack((x + xc, y + yc))
-        shifted_points = np.array([self.shift((px, py)) for px, py in points])
+    def saving_image(self, extension):
+        """
+        Постановка изображения в очередь на сохранение в указанном формате.
+        Сохранение выполняется в фоновом процессе по снимку наложения слоев,
+        поэтому рисование можно продолжать сразу.
 
-        for px, py in shifted_points:
-            pygame.draw.rect(
-                self.last_surface, self.brush_color, (px, py, self.size, self.size)
-            )
+        Args:
+            extension (str): Расширение файла ("jpg" или "png")
+        """
+        self.export_worker.submit(
+            self.layers,
+            self.saving_size,
+            extension,
+            # Для JPG требуется белый фон, для PNG сохраняется прозрачность
+            Color.WHITE if extension == "jpg" else None,
+            self.image_dir,
+            self.backdrop.data if self.backdrop else None,
+        )
+        button = f"save_{extension}"
+        self.exports_in_progress[button] += 1
+        self.mark_dirty(self.button_rect(button))
 
-    def bresenham(self, x1, y1, x2, y2):
+    def finish_saving(self, result):
         """
-        Векторизованная реализация алгоритма Брезенхэма для рисования линии.
+        Обработка завершения фонового сохранения: подсветка кнопки результатом.
 
         Args:
-            x1 (int): Начальная x-координата
-            y1 (int): Начальная y-координата
-            x2 (int): Конечная x-координата
-            y2 (int): Конечная y-координата
-
-        Returns:
-            numpy.ndarray: Массив точек линии
+            result (dict): Результат задания из события ExportWorker.EXPORT_DONE
         """
-        x1, y1, x2, y2 = map(np.array, [x1, y1, x2, y2])
+        button = f"save_{result['extension']}"
+        self.exports_in_progress[button] -= 1
+        self.saving_button = button
+        self.flash_end = time.monotonic() + self.flash_time
+        self.mark_dirty(self.button_rect(button))
+        if "error" in result:
+            self.is_saving_successful = False
+            print(f"Error saving image: {result['error']}")
+            return
+        self.is_saving_successful = True
+        self.last_export = result
+        print(
+            f"Image saved: {result['path']} ({result['seconds']:.2f} s, "
+            f"peak {result['peak_bytes'] / 2**20:.1f} MB)"
+        )
 
-        if x1 == x2 and y1 == y2:
-            return np.array([[x1, y1]])
+    def import_image(self, path):
+        """
+        Загрузка изображения PNG или JPG фоном листа. Файл декодируется
+        в фоновом потоке, изображение появляется на листе, когда готова
+        его уменьшенная копия.
 
-        dx = np.abs(x2 - x1)
-        dy = np.abs(y2 - y1)
+        Args:
+            path (str): Путь к файлу
+        """
+        self.importing = path
+        self.import_worker.submit(path, (self.WIDTH_SHEET, self.HEIGHT_SHEET))
+        print(f"Importing image: {path}")
 
-        x_inc = np.where(x2 > x1, 1, -1)
-        y_inc = np.where(y2 > y1, 1, -1)
+    def finish_import(self, result):
+        """
+        Обработка завершения фоновой загрузки: новое фоновое изображение
+        или копия текущего для другого масштаба.
 
-        if dx > dy:
-            x = np.arange(x1, x2 + x_inc, x_inc)
-            if x2 != x1:
-                y = y1 + np.round((x - x1) * (y2 - y1) / (x2 - x1))
-            else:
-                y = np.full_like(x, y1)
+        Args:
+            result (dict): Результат задания из события ImportWorker.IMPORT_DONE
+        """
+        current = self.backdrop and result["path"] == self.backdrop.path
+        if "error" in result:
+            if result["path"] == self.importing:
+                self.importing = None
+            elif current:
+                self.backdrop.pending.discard(result["sheet_size"])
+            print(f"Error importing image: {result['error']}")
+            return
+        proxy = result["proxy"]
+        if result["path"] == self.importing:
+            self.importing = None
+            self.backdrop = Backdrop(
+                result["path"], result["source_size"], result["data"]
+            )
+            print(
+                f"Image imported: {result['path']} "
+                f"({result['source_size'][0]}x{result['source_size'][1]}, "
+                f"{result['seconds']:.2f} s)"
+            )
+        elif not current:
+            return  # Копия уже замененного изображения
+        # Копия переводится в формат экрана, чтобы быстро рисоваться
+        if proxy.get_flags() & pygame.SRCALPHA:
+            proxy = proxy.convert_alpha()
         else:
-            y = np.arange(y1, y2 + y_inc, y_inc)
-            if y2 != y1:
-                x = x1 + np.round((y - y1) * (x2 - x1) / (y2 - y1))
-            else:
-                x = np.full_like(y, x1)
+            proxy = proxy.convert()
+        self.backdrop.add(result["sheet_size"], proxy)
+        # Масштаб мог измениться, пока копия загружалась
+        self.backdrop.request(self.import_worker, (self.WIDTH_SHEET, self.HEIGHT_SHEET))
+        self.mark_dirty()
 
-        points = np.column_stack((x.astype(int), y.astype(int)))
+    def sheet_state(self):
+        """
+        Признаки изменения листа: история действий и свойства слоев.
 
-        return points
+        Returns:
+            tuple: Состояние, которое меняется при каждом изменении листа
+        """
+        return (
+            self.history,
+            self.history.version,
+            tuple(
+                (id(layer), layer.name, layer.visible, layer.opacity, layer.locked)
+                for layer in self.layers.layers
+            ),
+        )
 
-    def saving_image(self, extension):
+    def confirm(self, command):
         """
-        Сохранение изображения в указанном формате.
+        Подтверждение команды, которая заменяет лист. Если на листе есть
+        несохраненные изменения, команду нужно повторить, не меняя лист.
 
         Args:
-            extension (str): Расширение файла ("jpg" или "png")
+            command (str): Сочетание клавиш команды для сообщения
+
+        Returns:
+            bool: True, если команду можно выполнять
         """
+        state = self.sheet_state()
+        if state == self.saved_state or self.confirming == (command, state):
+            self.confirming = None
+            return True
+        self.confirming = (command, state)
+        print(f"Unsaved changes will be lost, press {command} again to continue")
+        return False
+
+    def save_project(self):
+        """
+        Сохранение слоев и штрихов листа в файл проекта.
+        В файл, открытый или сохраненный в этом сеансе, дописываются только
+        изменения с прошлого сохранения. Существующий файл, который в этом
+        сеансе не открывался, не перезаписывается: лист сохраняется в файл
+        со следующим свободным номером.
+        """
+        if self.project.end is None:
+            self.project.path = free_path(self.project_path)
         try:
-            # Создание поверхности для сохранения с учетом размера
-            full_surface = pygame.Surface(self.saving_size, pygame.SRCALPHA)
-            if extension == "jpg":
-                # Для JPG требуется белый фон
-                full_surface.fill((Color.WHITE))
-            else:
-                # Для PNG сохраняется прозрачность
-                full_surface.fill((0, 0, 0, 0))
+            result = self.project.save(self.layers.layers, self.grid_rect().size)
+        except OSError as e:
+            print(f"Error saving project: {e}")
+            return
+        self.saved_state = self.sheet_state()
+        print(
+            f"Project saved: {self.project.path} ({result['strokes']} new strokes, "
+            f"{result['masks']} erased, {result['bytes'] / 1024:.1f} KB appended)"
+        )
 
-            # Масштабирование и объединение всех поверхностей
-            for surface in self.surfaces:
-                temp_surface = pygame.transform.scale(surface, self.saving_size)
-                full_surface.blit(temp_surface, (0, 0))
+    def open_project(self):
+        """
+        Загрузка листа из файла проекта. История действий очищается.
+        Открывается файл, открытый или сохраненный в этом сеансе, а если
+        такого нет - последний сохраненный из нумерованных копий проекта.
+        """
+        if self.drawing:
+            return
+        if self.project.end is None:
+            self.project.path = latest_path(self.project_path)
+        try:
+            layers = self.project.load(self.grid_rect().size)
+        except (OSError, ProjectError) as e:
+            print(f"Error opening project: {e}")
+            return
+        self.load_layers(layers)
+        self.saved_state = self.sheet_state()
+        count = sum(len(layer.strokes) for layer in layers)
+        print(
+            f"Project opened: {self.project.path} "
+            f"({len(layers)} layers, {count} strokes)"
+        )
 
-            image_dir = os.path.join("..", "saved_images")
-            if not os.path.exists(image_dir):
-                os.mkdir(image_dir)
+    def recover_autosave(self):
+        """
+        Восстановление листа из журнала автосохранения, оставшегося
+        после аварийного завершения прошлого сеанса. Восстановленный лист
+        сразу записывается в журнал этого сеанса.
+        """
+        if self.drawing:
+            return
+        try:
+            layers = self.autosave.recover(self.grid_rect().size)
+        except (OSError, ProjectError) as e:
+            print(f"Error recovering autosave: {e}")
+            return
+        self.load_layers(layers)
+        self.autosave.flush(self)
+        count = sum(len(layer.strokes) for layer in layers)
+        print(
+            f"Autosave recovered: {self.autosave.recovered_path} "
+            f"({len(layers)} layers, {count} strokes)"
+        )
 
-            i = 1
-            while os.path.exists(
-                os.path.join(image_dir, f"drawing_{extension} ({i}).{extension}")
-            ):
-                i += 1
+    def load_layers(self, layers):
+        """
+        Замена листа загруженными слоями. История действий очищается.
 
-            pygame.image.save(
-                full_surface,
-                os.path.join(image_dir, f"drawing_{extension} ({i}).{extension}"),
-            )
-            self.is_saving_successful = True
-        except Exception as e:
-            self.is_saving_successful = False
-            print(f"Error saving image: {e}")
+        Args:
+            layers (list): Слои листа снизу вверх
+        """
+        self.layers = LayerStack(self.grid_size, layers)
+        self.history = History(self.history_limit)
+        for layer in layers:
+            self.redraw_canvas_region(self.grid_rect(), layer)
+        self.layers_changed()
 
 
 if __name__ == "__main__":
-    Paint().run()
+    parser = argparse.ArgumentParser(description="MyPaint")
+    parser.add_argument(
+        "--record", metavar="LOG", help="record input events to LOG on exit"
+    )
+    parser.add_argument(
+        "--grid",
+        metavar="WxH",
+        type=parse_grid,
+        default=(80, 55),
+        help="sheet size in cells (default 80x55)",
+    )
+    parser.add_argument(
+        "--image", metavar="PATH", help="PNG or JPG image to use as the background"
+    )
+    args = parser.parse_args()
+    paint = Paint(args.grid)
+    if args.record:
+        paint.recorder = EventRecorder(args.record)
+    if args.image:
+        # Загрузка идет через очередь событий, чтобы попасть в запись
+        pygame.event.post(pygame.event.Event(pygame.DROPFILE, file=args.image))
+    paint.run()
@@ -0,0 +1,255 @@
+"""
+MyPaint - Профилирование кадров по этапам
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import csv
+import json
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import numpy as np
+import pygame
+
+from export import surface_nbytes
+
+NO_PHASE = nullcontext()  # Этап выключенного профилировщика ничего не делает
+
+
+class Phase:
+    """
+    Замер одного этапа кадра. Используется как контекстный менеджер.
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler.phases.append((self.name, self.start, end - self.start))
+
+
+class FrameProfiler:
+    """
+    Профилировщик кадров основного цикла.
+    Для каждого кадра сохраняются этапы с временем начала и длительностью,
+    количество поверхностей pygame и занимаемая ими память. Этапы могут быть
+    вложенными: время внешнего этапа включает время внутренних.
+
+    Attributes:
+        enabled (bool): Включен ли профилировщик
+        frames (collections.deque): Последние кадры
+    """
+
+    def __init__(self, history=3600):
+        self.enabled = False
+        self.frames = deque(maxlen=history)
+        self.phases = []
+        self.frame_start = None
+
+    def toggle(self):
+        """
+        Включение и выключение профилировщика. При включении
+        ранее собранные кадры удаляются.
+        """
+        self.enabled = not self.enabled
+        self.frames.clear()
+        self.phases = []
+        self.frame_start = None
+
+    def phase(self, name):
+        """
+        Замер этапа кадра.
+
+        Args:
+            name (str): Название этапа
+
+        Returns:
+            Phase: Контекстный менеджер замера
+        """
+        if not self.enabled:
+            return NO_PHASE
+        return Phase(self, name)
+
+    def begin_frame(self):
+        """
+        Начало нового кадра.
+        """
+        if self.enabled:
+            self.phases = []
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self, surfaces):
+        """
+        Завершение кадра.
+
+        Args:
+            surfaces (iterable): Поверхности pygame, существующие в этом кадре
+        """
+        if not self.enabled or self.frame_start is None:
+            return
+        unique = {id(surface): surface for surface in surfaces}
+        self.frames.append(
+            {
+                "start": self.frame_start,
+                "duration": time.perf_counter() - self.frame_start,
+                "phases": self.phases,
+                "surfaces": len(unique),
+                "surface_bytes": sum(map(surface_nbytes, unique.values())),
+            }
+        )
+        self.phases = []
+
+    def summary(self, count=60):
+        """
+        Средние значения по последним кадрам.
+
+        Args:
+            count (int): Количество кадров
+
+        Returns:
+            dict: Частота кадров, время кадра и этапов в мс, поверхности
+        """
+        frames = list(self.frames)[-count:]
+        if not frames:
+            return None
+        durations = np.array([frame["duration"] for frame in frames]) * 1000
+        phases = {}
+        for frame in frames:
+            for name, _, duration in frame["phases"]:
+                phases[name] = phases.get(name, 0.0) + duration * 1000
+        span = frames[-1]["start"] + frames[-1]["duration"] - frames[0]["start"]
+        return {
+            "fps": len(frames) / span if span > 0 else 0.0,
+            "frame_ms": float(durations.mean()),
+            "max_ms": float(durations.max()),
+            "phases": {
+                name: total / len(frames)
+                for name, total in sorted(phases.items(), key=lambda x: -x[1])
+            },
+            "surfaces": frames[-1]["surfaces"],
+            "surface_bytes": frames[-1]["surface_bytes"],
+        }
+
+    def export(self, directory):
+        """
+        Сохранение собранных кадров в CSV (строка на кадр, столбец на этап)
+        и в JSON формата Trace Event для chrome://tracing и Perfetto.
+
+        Args:
+            directory (str): Папка для файлов
+
+        Returns:
+            tuple: Пути к файлам CSV и JSON
+        """
+        frames = list(self.frames)
+        names = sorted({name for frame in frames for name, _, _ in frame["phases"]})
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, time.strftime("profile_%Y%m%d_%H%M%S"))
+
+        with open(base + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                ["frame", "frame_ms", *(f"{name}_ms" for name in names)]
+                + ["surfaces", "surface_bytes"]
+            )
+            for i, frame in enumerate(frames):
+                totals = dict.fromkeys(names, 0.0)
+                for name, _, duration in frame["phases"]:
+                    totals[name] += duration * 1000
+                writer.writerow(
+                    [i, round(frame["duration"] * 1000, 3)]
+                    + [round(totals[name], 3) for name in names]
+                    + [frame["surfaces"], frame["surface_bytes"]]
+                )
+
+        origin = frames[0]["start"] if frames else 0.0
+        events = []
+        for frame in frames:
+            events.append(
+                trace_event("frame", frame["start"], frame["duration"], origin)
+            )
+            events.extend(
+                trace_event(name, start, duration, origin)
+                for name, start, duration in frame["phases"]
+            )
+            events.append(
+                {
+                    "name": "surfaces",
+                    "ph": "C",
+                    "ts": (frame["start"] - origin) * 1e6,
+                    "pid": 0,
+                    "args": {"bytes": frame["surface_bytes"]},
+                }
+            )
+        with open(base + ".json", "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        return base + ".csv", base + ".json"
+
+
+def trace_event(name, start, duration, origin):
+    """
+    Событие полного этапа в формате Trace Event.
+
+    Args:
+        name (str): Название этапа
+        start (float): Время начала по time.perf_counter
+        duration (float): Длительность в секундах
+        origin (float): Время начала записи
+
+    Returns:
+        dict: Событие с временем в микросекундах
+    """
+    return {
+        "name": name,
+        "ph": "X",
+        "ts": (start - origin) * 1e6,
+        "dur": duration * 1e6,
+        "pid": 0,
+        "tid": 0,
+    }
+
+
+def render_hud(summary, font):
+    """
+    Отрисовка панели производительности.
+
+    Args:
+        summary (dict): Результат FrameProfiler.summary
+        font (pygame.font.Font): Шрифт
+
+    Returns:
+        pygame.Surface: Полупрозрачная панель с текстом
+    """
+    rows = [
+        ("fps", f"{summary['fps']:.0f}"),
+        ("frame", f"{summary['frame_ms']:.2f} ms (max {summary['max_ms']:.2f})"),
+        *((name, f"{ms:.2f} ms") for name, ms in summary["phases"].items()),
+        (
+            f"surfaces {summary['surfaces']}",
+            f"{summary['surface_bytes'] / 2**20:.1f} MB",
+        ),
+    ]
+    color = (255, 255, 255)
+    images = [
+        (font.render(left, True, color), font.render(right, True, color))
+        for left, right in rows
+    ]
+    left_width = max(left.get_width() for left, _ in images)
+    right_width = max(right.get_width() for _, right in images)
+    height = font.get_linesize()
+    hud = pygame.Surface(
+        (left_width + right_width + 24, height * len(rows) + 8), pygame.SRCALPHA
+    )
+    hud.fill((0, 0, 0, 170))
+    for i, (left, right) in enumerate(images):
+        hud.blit(left, (6, 4 + i * height))
+        hud.blit(right, (hud.get_width() - 6 - right.get_width(), 4 + i * height))
+    return hud
@@ -0,0 +1,577 @@
+"""
+MyPaint - Файл проекта с послойным хранением штрихов
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import glob
+import mmap
+import os
+import struct
+import weakref
+
+import numpy as np
+import pygame
+
+from history import Stroke
+from layers import Layer
+
+MAGIC = b"MYPAINT\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHH2x")  # Сигнатура, версия, размер листа в клетках
+MAX_SIDE = 2**16 - 1  # Наибольшая сторона листа, которую вмещает заголовок
+CHUNK = struct.Struct("<4sI")  # Тип блока и длина данных
+# Номер, цвет RGBA, длина имени инструмента, число клеток и прямоугольник штриха
+STROKE = struct.Struct("<I4BII4i")
+# Число штрихов слоя, видимость, непрозрачность, блокировка и имя слоя
+LAYER = np.dtype(
+    [
+        ("strokes", "<u4"),
+        ("visible", "u1"),
+        ("opacity", "u1"),
+        ("locked", "u1"),
+        ("reserved", "u1"),
+        ("name", "S24"),
+    ]
+)
+ALIGN = 8  # Данные блоков выравниваются для чтения массивов без копирования
+
+
+class ProjectError(Exception):
+    """
+    Ошибка чтения файла проекта.
+    """
+
+
+class ProjectFile:
+    """
+    Файл проекта MyPaint: журнал блоков, который только дописывается.
+
+    Файл начинается с заголовка, за которым следуют блоки:
+    - STRK: новый штрих (номер, цвет, инструмент и массив клеток int32)
+    - ERAS: маска стирания штриха, упакованная по битам
+    - LAYR: слои снизу вверх (число штрихов, видимость, непрозрачность,
+      блокировка и имя)
+    - ORDR: номера штрихов листа в порядке рисования, слой за слоем
+
+    При каждом сохранении дописываются только новые штрихи, измененные маски
+    стирания и в конце слои и порядок штрихов. Последний полностью записанный
+    блок ORDR вместе с предшествующим ему блоком LAYR описывает лист, поэтому
+    прерванное сохранение не портит файл. Файлы без блоков LAYR загружаются
+    как лист из одного слоя.
+    Клетки штрихов при загрузке не копируются, а читаются из отображенного
+    в память файла по мере обращения к ним.
+
+    Attributes:
+        path (str): Путь к файлу проекта
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        self.end = None  # Конец последнего целого блока, None - файл не открыт
+        self.ids = weakref.WeakKeyDictionary()  # Номера уже записанных штрихов
+        self.masks = weakref.WeakKeyDictionary()  # Записанные маски стирания
+        self.next_id = 0
+        self.order = None  # Последний записанный порядок штрихов
+        self.layout = None  # Последнее записанное описание слоев
+
+    def save(self, layers, grid_size):
+        """
+        Дописывание в файл изменений листа с момента прошлого сохранения.
+
+        Args:
+            layers (list): Слои листа снизу вверх
+            grid_size (tuple): Размер листа в клетках
+
+        Returns:
+            dict: Количество новых штрихов, масок и записанных байт
+        """
+        chunks, state = self.changes(layers)
+        if chunks is None:
+            return {"strokes": 0, "masks": 0, "bytes": 0}
+        written = self.append(chunks, grid_size)
+        self.accept(state)
+        return {
+            "strokes": len(state["ids"]),
+            "masks": len(state["masks"]),
+            "bytes": written,
+        }
+
+    def changes(self, layers, masks=None, touched=None):
+        """
+        Блоки изменений листа с момента прошлого сохранения. Данные блоков
+        не меняются редактором, поэтому их можно записывать в другом потоке.
+
+        Args:
+            layers (list): Слои листа снизу вверх или их копии из SheetCopy
+            masks (dict): Маски стирания штрихов, по умолчанию берутся
+                из самих штрихов
+            touched (list): Штрихи, которые могли появиться или измениться
+                с прошлого сохранения, None - все штрихи листа
+
+        Returns:
+            tuple: Список блоков (тип, заголовок, данные) и состояние файла
+                после их записи для accept или (None, None), если лист
+                не изменился
+        """
+        strokes = [stroke for layer in layers for stroke in layer.strokes]
+        layout = np.array(
+            [
+                (
+                    len(layer.strokes),
+                    layer.visible,
+                    layer.opacity,
+                    layer.locked,
+                    0,
+                    layer.name.encode()[: LAYER["name"].itemsize],
+                )
+                for layer in layers
+            ],
+            dtype=LAYER,
+        )
+        ids = {}
+        erased = {}
+        chunks = []
+        next_id = self.next_id
+        for stroke in strokes if touched is None else touched:
+            if stroke not in self.ids:
+                ids[stroke] = next_id
+                next_id += 1
+                tool = stroke.tool.encode()
+                head = STROKE.pack(
+                    ids[stroke],
+                    *stroke.color,
+                    len(tool),
+                    len(stroke.cells),
+                    *stroke.rect,
+                )
+                chunks.append((b"STRK", head + pad(tool), stroke.cells))
+            mask = stroke.erased if masks is None else masks.get(stroke)
+            if mask is not None and not np.array_equal(self.masks.get(stroke), mask):
+                erased[stroke] = mask.copy()
+                number = self.ids.get(stroke, ids.get(stroke))
+                chunks.append(
+                    (b"ERAS", struct.pack("<I", number), np.packbits(mask, axis=None))
+                )
+        order = np.array(
+            [self.ids.get(stroke, ids.get(stroke)) for stroke in strokes],
+            dtype=np.uint32,
+        )
+        if (
+            not chunks
+            and np.array_equal(order, self.order)
+            and np.array_equal(layout, self.layout)
+        ):
+            return None, None
+        chunks.append((b"LAYR", struct.pack("<I", len(layout)), layout))
+        chunks.append((b"ORDR", struct.pack("<I", len(order)), order))
+        state = {
+            "ids": ids,
+            "masks": erased,
+            "next_id": next_id,
+            "order": order,
+            "layout": layout,
+        }
+        return chunks, state
+
+    def append(self, chunks, grid_size):
+        """
+        Запись блоков в конец файла.
+
+        Args:
+            chunks (list): Блоки (тип, заголовок, данные)
+            grid_size (tuple): Размер листа в клетках для заголовка нового файла
+
+        Returns:
+            int: Количество записанных байт
+
+        Raises:
+            FileExistsError: Новый файл перезаписал бы существующий
+        """
+        # Файл, не открытый и не сохраненный в этом сеансе, создается заново
+        # и не должен существовать, иначе изменения дописываются после
+        # последнего целого блока
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "xb" if self.end is None else "r+b") as f:
+            if self.end is None:
+                f.write(HEADER.pack(MAGIC, VERSION, *grid_size))
+            else:
+                if f.seek(0, os.SEEK_END) > self.end:
+                    f.truncate(self.end)  # Хвост прерванного сохранения
+                f.seek(self.end)
+            start = f.tell()
+            for tag, head, data in chunks:
+                payload = pad(pad(head) + data.tobytes())
+                f.write(CHUNK.pack(tag, len(payload)) + payload)
+            self.end = f.tell()
+        return self.end - start
+
+    def accept(self, state):
+        """
+        Учет записанных изменений: следующие сохранения не повторяют их.
+
+        Args:
+            state (dict): Состояние файла из changes
+        """
+        self.ids.update(state["ids"])
+        self.masks.update(state["masks"])
+        self.next_id = state["next_id"]
+        self.order = state["order"]
+        self.layout = state["layout"]
+
+    def load(self, grid_size):
+        """
+        Загрузка слоев и штрихов из файла проекта.
+
+        Args:
+            grid_size (tuple): Размер листа в клетках
+
+        Returns:
+            list: Слои листа снизу вверх
+
+        Raises:
+            ProjectError: Файл поврежден или создан для листа другого размера
+        """
+        if os.path.getsize(self.path) < HEADER.size:
+            raise ProjectError("file is too short")
+        with open(self.path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, *size = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ProjectError("not a MyPaint project")
+        if tuple(size) != tuple(grid_size):
+            raise ProjectError(f"sheet size {size[0]}x{size[1]} is not supported")
+
+        sheet = pygame.Rect((0, 0), grid_size)
+        strokes = {}
+        order = np.zeros(0, dtype=np.uint32)
+        layout = pending = None  # Слои последнего целого ORDR и следующего за ним
+        offset = HEADER.size
+        try:
+            while offset + CHUNK.size <= len(data):
+                tag, length = CHUNK.unpack_from(data, offset)
+                start = offset + CHUNK.size
+                if start + length > len(data):
+                    break  # Недописанный блок прерванного сохранения
+                if tag == b"STRK":
+                    number, r, g, b, a, tool_length, count, *rect = STROKE.unpack_from(
+                        data, start
+                    )
+                    tool_start = start + padded(STROKE.size)
+                    tool = bytes(data[tool_start : tool_start + tool_length]).decode()
+                    cells = np.frombuffer(
+                        data,
+                        dtype=np.int32,
+                        count=2 * count,
+                        offset=tool_start + padded(tool_length),
+                    )
+                    rect = pygame.Rect(rect)
+                    if not rect or not sheet.contains(rect):
+                        raise ValueError(f"stroke {number} is outside the sheet")
+                    strokes[number] = Stroke(tool, (r, g, b, a), cells, rect)
+                elif tag == b"ERAS":
+                    (number,) = struct.unpack_from("<I", data, start)
+                    stroke = strokes[number]
+                    bits = np.frombuffer(
+                        data, dtype=np.uint8, count=length - ALIGN, offset=start + ALIGN
+                    )
+                    count = stroke.rect.width * stroke.rect.height
+                    if not 0 < count <= 8 * len(bits):
+                        raise ValueError(f"mask does not fit stroke {number}")
+                    stroke.erased = (
+                        np.unpackbits(bits[: (count + 7) // 8], count=count)
+                        .astype(bool)
+                        .reshape(stroke.rect.size)
+                    )
+                elif tag == b"LAYR":
+                    (count,) = struct.unpack_from("<I", data, start)
+                    pending = np.frombuffer(
+                        data, dtype=LAYER, count=count, offset=start + ALIGN
+                    )
+                elif tag == b"ORDR":
+                    (count,) = struct.unpack_from("<I", data, start)
+                    order = np.frombuffer(
+                        data, dtype=np.uint32, count=count, offset=start + ALIGN
+                    )
+                    layout, pending = pending, None
+                offset = start + length
+        except (KeyError, IndexError, ValueError, struct.error) as e:
+            # Поврежденный блок: неизвестный номер штриха, штрих за пределами
+            # листа, неверная длина данных или имя инструмента не в UTF-8
+            raise ProjectError(f"damaged chunk at offset {offset}: {e}") from e
+
+        self.map = data
+        self.end = offset
+        self.ids = weakref.WeakKeyDictionary(
+            (stroke, number) for number, stroke in strokes.items()
+        )
+        self.masks = weakref.WeakKeyDictionary(
+            (stroke, stroke.erased.copy())
+            for stroke in strokes.values()
+            if stroke.erased is not None
+        )
+        self.next_id = max(strokes, default=-1) + 1
+        self.order = order
+        self.layout = layout
+
+        if layout is None:
+            layout = np.array([(len(order), 1, 255, 0, 0, b"Layer 1")], dtype=LAYER)
+        layers = []
+        bounds = np.cumsum(layout["strokes"])[:-1]
+        for row, numbers in zip(layout, np.split(order, bounds)):
+            layer = Layer(
+                row["name"].decode(errors="replace"),
+                grid_size,
+                visible=bool(row["visible"]),
+                opacity=int(row["opacity"]),
+                locked=bool(row["locked"]),
+            )
+            for number in numbers.tolist():
+                if number in strokes:
+                    layer.strokes.append(strokes[number])
+            layers.append(layer)
+        return layers
+
+
+class LayerCopy:
+    """
+    Копия слоя для записи в другом потоке: свойства и порядок штрихов.
+
+    Attributes:
+        name (str): Имя слоя
+        visible (bool): Видимость
+        opacity (int): Непрозрачность от 0 до 255
+        locked (bool): Блокировка
+        order (dict): Порядковые номера штрихов слоя
+    """
+
+    def __init__(self):
+        self.name = ""
+        self.visible = True
+        self.opacity = 255
+        self.locked = False
+        self.order = {}
+        self.sorted = []  # Штрихи в порядке рисования, None - нужна сортировка
+
+    @property
+    def strokes(self):
+        """
+        Штрихи слоя в порядке рисования.
+
+        Returns:
+            list: Штрихи
+        """
+        if self.sorted is None:
+            self.sorted = sorted(self.order, key=self.order.get)
+        return self.sorted
+
+    def update(self, stroke, number):
+        """
+        Учет добавления или удаления штриха.
+
+        Args:
+            stroke (Stroke): Штрих
+            number (int): Порядковый номер штриха на слое, None - штриха
+                на слое нет
+        """
+        if number is None:
+            if self.order.pop(stroke, None) is not None:
+                self.sorted = None
+            return
+        previous = self.order.get(stroke)
+        if previous == number:
+            return
+        last = self.sorted[-1] if self.sorted else None
+        self.order[stroke] = number
+        if (
+            previous is None
+            and self.sorted is not None
+            and (last is None or self.order[last] < number)
+        ):
+            self.sorted.append(stroke)  # Новый штрих поверх остальных
+        else:
+            self.sorted = None
+
+
+class SheetCopy:
+    """
+    Копия состава листа для записи в фоновом потоке. Основной поток
+    собирает функцией capture только затронутые штрихи, а копия
+    обновляется ими в потоке записи, поэтому время работы основного потока
+    не зависит от числа штрихов на листе. Сами штрихи не копируются:
+    их клетки не меняются, а маски стирания передаются копиями.
+
+    Attributes:
+        layers (list): Копии слоев LayerCopy снизу вверх
+        masks (weakref.WeakKeyDictionary): Копии масок стирания штрихов
+    """
+
+    def __init__(self):
+        self.layers = []
+        self.copies = {}  # Копии слоев по слоям листа
+        self.masks = weakref.WeakKeyDictionary()
+
+    def update(self, sheet):
+        """
+        Обновление копии собранными изменениями листа.
+
+        Args:
+            sheet (dict): Изменения листа из capture
+
+        Returns:
+            list: Затронутые штрихи, которые есть на листе, или None,
+                если собран весь лист
+        """
+        copies = {}
+        for layer, properties in sheet["layers"]:
+            copy = copies[layer] = self.copies.get(layer) or LayerCopy()
+            copy.name, copy.visible, copy.opacity, copy.locked = properties
+        touched = {}  # Штрих может быть затронут несколько раз
+        for layer, order in sheet["orders"].items():
+            copies[layer].order = order
+            copies[layer].sorted = None
+            touched.update(dict.fromkeys(order, copies[layer]))
+        for layer, stroke, number, mask in sheet["strokes"]:
+            if mask is not None:
+                self.masks[stroke] = mask
+            if layer in copies:
+                copies[layer].update(stroke, number)
+                touched[stroke] = copies[layer]
+        self.copies = copies
+        self.layers = [copies[layer] for layer, _ in sheet["layers"]]
+        if sheet["full"]:
+            return None
+        return [stroke for stroke, copy in touched.items() if stroke in copy.order]
+
+
+def capture(layers, touched=None):
+    """
+    Сбор изменений листа для SheetCopy в основном потоке. Копируются
+    свойства слоев, порядковые номера затронутых штрихов и их маски
+    стирания; порядок штрихов слоя копируется целиком только для новых
+    слоев или при сборе всего листа.
+
+    Args:
+        layers (list): Слои листа снизу вверх
+        touched (list): Пары (слой, штрих), затронутые с прошлого сбора,
+            штрих None - слой целиком; None - весь лист
+
+    Returns:
+        dict: Свойства слоев, порядок штрихов целых слоев и затронутые
+            штрихи с номерами и масками
+    """
+    strokes = []
+    orders = {}
+    full = touched is None
+    if full:
+        touched = [(layer, None) for layer in layers]
+    present = set(layers)
+    for layer, stroke in touched:
+        if stroke is None:
+            if layer in present and layer not in orders:
+                orders[layer] = dict(layer.strokes.order)
+                strokes.extend(
+                    (layer, stroke, number, stroke.erased.copy())
+                    for stroke, number in orders[layer].items()
+                    if stroke.erased is not None
+                )
+        else:
+            mask = None if stroke.erased is None else stroke.erased.copy()
+            strokes.append((layer, stroke, layer.strokes.order.get(stroke), mask))
+    return {
+        "layers": [
+            (layer, (layer.name, layer.visible, layer.opacity, layer.locked))
+            for layer in layers
+        ],
+        "orders": orders,
+        "strokes": strokes,
+        "full": full,
+    }
+
+
+def free_path(path):
+    """
+    Первое свободное имя файла: к имени существующего файла добавляется
+    номер вида "drawing (1).mypaint".
+
+    Args:
+        path (str): Желаемый путь к файлу
+
+    Returns:
+        str: Путь к файлу, которого еще нет
+    """
+    root, extension = os.path.splitext(path)
+    i = 0
+    while os.path.exists(path):
+        i += 1
+        path = f"{root} ({i}){extension}"
+    return path
+
+
+def latest_path(path):
+    """
+    Последний сохраненный файл среди файла и его нумерованных копий,
+    которые создает free_path.
+
+    Args:
+        path (str): Путь к файлу без номера
+
+    Returns:
+        str: Путь к файлу, измененному последним, или исходный путь,
+            если ни одного файла нет
+    """
+    root, extension = os.path.splitext(path)
+    paths = [
+        candidate
+        for candidate in glob.glob(f"{glob.escape(root)} (*){extension}")
+        if candidate[len(root) + 2 : len(candidate) - len(extension) - 1].isdigit()
+    ]
+    if os.path.exists(path):
+        paths.append(path)
+    return max(paths, key=os.path.getmtime, default=path)
+
+
+def parse_grid(value):
+    """
+    Разбор размера листа вида "WxH" из командной строки.
+
+    Args:
+        value (str): Размер листа в клетках
+
+    Returns:
+        tuple: Ширина и высота листа
+
+    Raises:
+        ValueError: Размер задан неверно или не помещается в заголовок
+            файла проекта
+    """
+    size = tuple(int(side) for side in value.split("x"))
+    if len(size) != 2 or not all(1 <= side <= MAX_SIDE for side in size):
+        raise ValueError(f"sheet sides must be from 1 to {MAX_SIDE}: {value}")
+    return size
+
+
+def padded(length):
+    """
+    Длина данных с выравниванием до ALIGN байт.
+
+    Args:
+        length (int): Длина в байтах
+
+    Returns:
+        int: Выровненная длина
+    """
+    return -(-length // ALIGN) * ALIGN
+
+
+def pad(data):
+    """
+    Дополнение данных нулями до выровненной длины.
+
+    Args:
+        data (bytes): Данные
+
+    Returns:
+        bytes: Выровненные данные
+    """
+    return data + b"\0" * (padded(len(data)) - len(data))
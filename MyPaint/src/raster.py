@@ -0,0 +1,280 @@
+"""
+MyPaint - Векторизованная растеризация по сетке кисти
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pygame
+
+
+def unique_cells(cells):
+    """
+    Удаление повторяющихся клеток. Клетки сортируются как в
+    np.unique(cells, axis=0), но сравниваются одним целым ключом,
+    что намного быстрее сравнения строк массива.
+
+    Args:
+        cells (numpy.ndarray): Массив клеток (x, y) формы (N, 2)
+
+    Returns:
+        numpy.ndarray: Массив уникальных клеток формы (M, 2)
+    """
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+    if len(cells) < 2:
+        return cells
+    low = cells.min(axis=0)
+    height = int(cells[:, 1].max() - low[1]) + 1
+    keys = np.unique((cells[:, 0] - low[0]) * height + (cells[:, 1] - low[1]))
+    return np.column_stack((keys // height, keys % height)) + low
+
+
+def cells_bounds(cells):
+    """
+    Ограничивающий прямоугольник набора клеток.
+
+    Args:
+        cells (numpy.ndarray): Массив клеток (x, y) формы (N, 2)
+
+    Returns:
+        pygame.Rect: Ограничивающий прямоугольник в клетках
+    """
+    x_min, y_min = np.min(cells, axis=0)
+    x_max, y_max = np.max(cells, axis=0)
+    return pygame.Rect(
+        int(x_min), int(y_min), int(x_max - x_min) + 1, int(y_max - y_min) + 1
+    )
+
+
+def polyline(points):
+    """
+    Точки ломаной по алгоритму Брезенхэма для всех отрезков за один вызов.
+    Каждый отрезок проходится с шагом 1 по большей из осей, координата
+    по другой оси округляется. Соседние отрезки имеют общую вершину.
+
+    Args:
+        points (numpy.ndarray): Целочисленные вершины (x, y) формы (N, 2)
+
+    Returns:
+        numpy.ndarray: Точки всех отрезков формы (M, 2), для одной вершины -
+            сама вершина
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    if len(points) < 2:
+        return points
+    delta = np.diff(points, axis=0)
+    steps = np.abs(delta).max(axis=1)
+    counts = steps + 1
+    # Номер отрезка и номер шага внутри отрезка для каждой точки
+    segment = np.repeat(np.arange(len(steps)), counts)
+    t = np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+    # По большей оси |delta| = steps и координата меняется ровно на t,
+    # по меньшей округляется
+    offset = t[:, None] * delta[segment] / np.maximum(steps, 1)[segment, None]
+    return points[segment] + np.round(offset).astype(np.int64)
+
+
+def cell_span(low, high, first, last):
+    """
+    Номера клеток, содержащих точки отрезка [low, high], в пределах [first, last).
+
+    Args:
+        low (float): Начало отрезка в клетках
+        high (float): Конец отрезка в клетках
+        first (float): Первая допустимая клетка
+        last (float): Клетка после последней допустимой
+
+    Returns:
+        numpy.ndarray: Номера клеток по возрастанию
+    """
+    return np.arange(max(math.floor(low), first), min(math.floor(high) + 1, last))
+
+
+def ellipse_cells(center, radii, bounds=None):
+    """
+    Клетки контура эллипса с осями, параллельными осям координат.
+    Как в алгоритме средней точки, контур делится на две области точкой,
+    где наклон касательной равен 1: в пологой области берется по две клетки
+    на столбец, в крутой - по две на строку. Количество клеток пропорционально
+    длине контура в клетках, контур получается без разрывов и повторов.
+    Если задана область bounds, клетки вне ее не вычисляются.
+
+    Args:
+        center (tuple): Центр в клетках, допускаются дробные значения
+        radii (tuple): Полуоси в клетках
+        bounds (pygame.Rect): Область в клетках, по умолчанию без ограничений
+
+    Returns:
+        numpy.ndarray: Массив клеток (x, y) формы (N, 2)
+    """
+    cx, cy = center
+    rx, ry = abs(radii[0]), abs(radii[1])
+    if bounds is None:
+        left = top = -math.inf
+        right = bottom = math.inf
+    else:
+        left, top, right, bottom = bounds.left, bounds.top, bounds.right, bounds.bottom
+
+    if rx == 0 or ry == 0:
+        # Вырожденный эллипс - отрезок или одна клетка
+        xs = cell_span(cx - rx, cx + rx, left, right)
+        ys = cell_span(cy - ry, cy + ry, top, bottom)
+        return np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1).reshape(-1, 2)
+
+    norm = math.hypot(rx, ry)
+    dx, dy = rx * rx / norm, ry * ry / norm  # Смещения точки с наклоном 1
+
+    # Пологая область: центры столбцов, прижатые к границе области
+    columns = cell_span(cx - dx, cx + dx, left, right)
+    x = np.clip(columns + 0.5, cx - dx, cx + dx)
+    h = ry * np.sqrt(np.maximum(0.0, 1 - ((x - cx) / rx) ** 2))
+    flat = np.concatenate(
+        (
+            np.column_stack((columns, np.floor(cy - h))),
+            np.column_stack((columns, np.floor(cy + h))),
+        )
+    )
+
+    # Крутая область: центры строк, прижатые к границе области
+    rows = cell_span(cy - dy, cy + dy, top, bottom)
+    y = np.clip(rows + 0.5, cy - dy, cy + dy)
+    w = rx * np.sqrt(np.maximum(0.0, 1 - ((y - cy) / ry) ** 2))
+    steep = np.concatenate(
+        (
+            np.column_stack((np.floor(cx - w), rows)),
+            np.column_stack((np.floor(cx + w), rows)),
+        )
+    )
+    cells = np.concatenate((flat, steep))
+    if bounds is not None:
+        inside = (cells[:, 0] >= left) & (cells[:, 0] < right)
+        inside &= (cells[:, 1] >= top) & (cells[:, 1] < bottom)
+        cells = cells[inside]
+    return unique_cells(cells)
+
+
+def arc_cells(center, radius, start, end, bounds=None):
+    """
+    Клетки дуги окружности от угла start до угла end по возрастанию угла.
+
+    Args:
+        center (tuple): Центр в клетках, допускаются дробные значения
+        radius (float): Радиус в клетках
+        start (float): Начальный угол в радианах
+        end (float): Конечный угол в радианах, не меньше start
+        bounds (pygame.Rect): Область в клетках, по умолчанию без ограничений
+
+    Returns:
+        numpy.ndarray: Массив клеток (x, y) формы (N, 2)
+    """
+    cells = ellipse_cells(center, (radius, radius), bounds)
+    angles = np.arctan2(cells[:, 1] + 0.5 - center[1], cells[:, 0] + 0.5 - center[0])
+    inside = np.mod(angles - start, 2 * math.pi) <= end - start
+    return cells[inside]
+
+
+def flood_fill(cells, seed, tolerance=0):
+    """
+    Связная область клеток, похожих по цвету на начальную.
+    Похожие клетки каждого столбца объединяются в отрезки, и заливка
+    распространяется от отрезка к пересекающимся с ним отрезкам соседних
+    столбцов. Соседние отрезки находятся бинарным поиском, поэтому цикл
+    на Python проходит только по отрезкам залитой области, а не по клеткам.
+
+    Args:
+        cells (numpy.ndarray): Массив RGBA формы (w, h, 4)
+        seed (tuple): Начальная клетка (x, y) в массиве
+        tolerance (int): Допустимое отличие каждого канала цвета
+
+    Returns:
+        numpy.ndarray: Булев массив формы (w, h) залитой области
+    """
+    width, height = cells.shape[:2]
+    color = cells[seed].astype(np.int16)
+    inside = np.ones((width, height), dtype=bool)
+    for channel in range(4):  # По каналам быстрее, чем сравнение по оси цвета
+        inside &= (
+            np.abs(cells[..., channel].astype(np.int16) - color[channel]) <= tolerance
+        )
+    similar = np.zeros((width, height + 2), dtype=np.int8)
+    similar[:, 1:-1] = inside
+
+    # Отрезки похожих клеток [start, end) по столбцам. Номер границы в
+    # развернутом массиве равен столбец * (height + 1) + строка, такие
+    # ключи упорядочены по столбцу и строке, а начала и концы чередуются.
+    row = height + 1
+    edges = np.flatnonzero(np.diff(similar, axis=1))
+    start_keys, end_keys = edges[0::2], edges[1::2]
+    starts, ends = start_keys.tolist(), end_keys.tolist()
+
+    first = bisect_right(starts, seed[0] * row + seed[1]) - 1
+    filled = {first}
+    stack = [first]
+    while stack:
+        run = stack.pop()
+        for shift in (-row, row):
+            # Отрезки соседнего столбца, пересекающиеся с текущим, идут подряд
+            low = bisect_right(ends, starts[run] + shift)
+            high = bisect_left(starts, ends[run] + shift)
+            for other in range(low, high):
+                if other not in filled:
+                    filled.add(other)
+                    stack.append(other)
+
+    runs = np.fromiter(filled, dtype=np.int64, count=len(filled))
+    bounds = np.zeros(width * row, dtype=np.int8)
+    bounds[start_keys[runs]] = 1
+    bounds[end_keys[runs]] = -1
+    return np.cumsum(bounds.reshape(width, row), axis=1, dtype=np.int8)[:, :height] > 0
+
+
+def stamp(surface, cells, size, color):
+    """
+    Отрисовка квадратных отпечатков кисти во всех клетках за одну операцию.
+    Клетки за пределами поверхности отбрасываются, повторы удаляются,
+    пиксели записываются напрямую через pygame.surfarray.
+
+    Args:
+        surface (pygame.Surface): Поверхность с попиксельной прозрачностью
+        cells (numpy.ndarray): Массив клеток (x, y) формы (N, 2)
+        size (int): Размер клетки в пикселях
+        color (tuple): Цвет RGB или RGBA
+    """
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+    grid = (surface.get_width() // size, surface.get_height() // size)
+    inside = np.all((cells >= 0) & (cells < grid), axis=1)
+    cells = unique_cells(cells[inside])
+    if not len(cells):
+        return
+
+    # Индексы всех пикселей отпечатков, форма (N, size, size)
+    offsets = np.arange(size)
+    xs = cells[:, 0, None, None] * size + offsets[None, :, None]
+    ys = cells[:, 1, None, None] * size + offsets[None, None, :]
+
+    color = tuple(int(c) for c in color)
+    pygame.surfarray.pixels3d(surface)[xs, ys] = color[:3]
+    pygame.surfarray.pixels_alpha(surface)[xs, ys] = color[3] if len(color) > 3 else 255
+
+
+def write_cells(surface, cells, rect, size):
+    """
+    Запись цветов клеток на поверхность размером с лист.
+
+    Args:
+        surface (pygame.Surface): Поверхность с попиксельной прозрачностью
+        cells (numpy.ndarray): Массив RGBA формы (w, h, 4)
+        rect (pygame.Rect): Область в клетках
+        size (int): Размер клетки в пикселях
+    """
+    # Клетки записываются на поверхность размером в одну клетку на пиксель,
+    # которая затем увеличивается сразу в нужную область без смешивания
+    small = pygame.Surface(cells.shape[:2], pygame.SRCALPHA, surface)
+    pygame.surfarray.pixels3d(small)[...] = cells[..., :3]
+    pygame.surfarray.pixels_alpha(small)[...] = cells[..., 3]
+    area = pygame.Rect(
+        rect.left * size, rect.top * size, rect.width * size, rect.height * size
+    )
+    pygame.transform.scale(small, area.size, surface.subsurface(area))
@@ -0,0 +1,322 @@
+"""
+MyPaint - Запись и воспроизведение событий ввода
+Copyright (c) 2025 Denis Korabelnikov
+
+Воспроизведение записи на новом экземпляре редактора:
+    python replay.py session.mplog             # с максимальной скоростью
+    python replay.py session.mplog --realtime  # с исходными интервалами
+    python replay.py session.mplog --grid 400x300  # запись на листе 400x300
+"""
+
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+import pygame
+
+from backdrop import ImportWorker
+
+MAGIC = b"MPLOG\0\0\1"
+HEADER = struct.Struct("<8s20sI")  # Сигнатура, SHA-1 итогового листа, число событий
+LENGTH = struct.Struct("<I")  # Число путей к файлам после событий и длина пути
+# Номер кадра, время от начала записи в мс, вид события и три поля данных
+EVENT = np.dtype(
+    [
+        ("frame", "<u4"),
+        ("time", "<u4"),
+        ("kind", "u1"),
+        ("a", "<i4"),
+        ("b", "<i4"),
+        ("c", "<i4"),
+    ]
+)
+# Записываемые виды событий, индекс в кортеже - код вида в журнале
+KINDS = (
+    pygame.MOUSEBUTTONDOWN,
+    pygame.MOUSEBUTTONUP,
+    pygame.MOUSEMOTION,
+    pygame.KEYDOWN,
+    pygame.KEYUP,
+    pygame.VIDEORESIZE,
+    pygame.WINDOWFOCUSLOST,
+    pygame.DROPFILE,
+    # Завершение фоновой загрузки изображения: при воспроизведении кадр
+    # с этим событием ждет окончания настоящей загрузки
+    ImportWorker.IMPORT_DONE,
+)
+
+
+def canvas_digest(canvas):
+    """
+    Контрольная сумма изображения листа. Лист читается полосами столбцов,
+    сумма совпадает с суммой массива всего листа формы (w, h, 4).
+
+    Args:
+        canvas (LayerStack): Слои листа или TiledCanvas с тем же чтением
+
+    Returns:
+        bytes: SHA-1 пикселей листа
+    """
+    digest = hashlib.sha1()
+    width, height = canvas.grid_size
+    for left in range(0, width, canvas.tile):
+        strip = pygame.Rect(left, 0, min(canvas.tile, width - left), height)
+        digest.update(canvas.read(strip).tobytes())
+    return digest.digest()
+
+
+def encode(event, files):
+    """
+    Упаковка события в поля журнала.
+
+    Args:
+        event (pygame.event.Event): Событие
+        files (list): Пути к файлам журнала, путь перетащенного файла
+            добавляется в конец, а в поле записывается его номер
+
+    Returns:
+        tuple: Код вида и поля (a, b, c) или None, если событие не записывается
+    """
+    if event.type not in KINDS:
+        return None
+    kind = KINDS.index(event.type)
+    if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+        return kind, event.pos[0], event.pos[1], event.button
+    if event.type == pygame.MOUSEMOTION:
+        buttons = sum(bit << i for i, bit in enumerate(event.buttons))
+        return kind, event.pos[0], event.pos[1], buttons
+    if event.type in (pygame.KEYDOWN, pygame.KEYUP):
+        return kind, event.mod, 0, event.key
+    if event.type == pygame.VIDEORESIZE:
+        return kind, event.w, event.h, 0
+    if event.type == pygame.DROPFILE:
+        files.append(event.file)
+        return kind, len(files) - 1, 0, 0
+    return kind, 0, 0, 0
+
+
+def decode(row, files):
+    """
+    Восстановление события из записи журнала.
+
+    Args:
+        row (numpy.void): Запись журнала
+        files (list): Пути к файлам журнала
+
+    Returns:
+        pygame.event.Event: Событие
+    """
+    kind, a, b, c = KINDS[row["kind"]], int(row["a"]), int(row["b"]), int(row["c"])
+    if kind in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+        return pygame.event.Event(kind, pos=(a, b), button=c)
+    if kind == pygame.MOUSEMOTION:
+        buttons = tuple((c >> i) & 1 for i in range(3))
+        return pygame.event.Event(kind, pos=(a, b), rel=(0, 0), buttons=buttons)
+    if kind in (pygame.KEYDOWN, pygame.KEYUP):
+        return pygame.event.Event(kind, key=c, mod=a)
+    if kind == pygame.VIDEORESIZE:
+        return pygame.event.Event(kind, w=a, h=b, size=(a, b))
+    if kind == pygame.DROPFILE:
+        return pygame.event.Event(kind, file=files[a])
+    return pygame.event.Event(kind)
+
+
+class EventRecorder:
+    """
+    Запись событий ввода, которые получает Paint.handle_events.
+    События группируются по кадрам основного цикла и хранятся со временем
+    от начала записи. Вместе с событиями сохраняется контрольная сумма
+    итогового листа для проверки воспроизведения.
+
+    Attributes:
+        path (str): Путь к файлу журнала
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = []
+        self.files = []  # Пути к перетащенным файлам
+        self.frame = 0
+        self.start = time.perf_counter()
+
+    def record(self, events):
+        """
+        Запись событий одного кадра.
+
+        Args:
+            events (list): События кадра
+        """
+        ms = int((time.perf_counter() - self.start) * 1000)
+        for event in events:
+            fields = encode(event, self.files)
+            if fields is not None:
+                self.rows.append((self.frame, ms, *fields))
+        self.frame += 1
+
+    def save(self, canvas):
+        """
+        Сохранение журнала в файл.
+
+        Args:
+            canvas (LayerStack): Итоговые слои листа
+        """
+        rows = np.array(self.rows, dtype=EVENT)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, canvas_digest(canvas), len(rows)))
+            f.write(rows.tobytes())
+            f.write(LENGTH.pack(len(self.files)))
+            for path in self.files:
+                data = path.encode()
+                f.write(LENGTH.pack(len(data)) + data)
+
+
+def load(path):
+    """
+    Чтение журнала событий.
+
+    Args:
+        path (str): Путь к файлу журнала
+
+    Returns:
+        tuple: Контрольная сумма итогового листа, массив записей EVENT
+            и пути к перетащенным файлам
+    """
+    with open(path, "rb") as f:
+        magic, digest, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a MyPaint event log")
+        rows = np.frombuffer(f.read(count * EVENT.itemsize), dtype=EVENT)
+        files = []
+        # В журналах без перетаскивания файлов таблицы путей может не быть
+        data = f.read(LENGTH.size)
+        for _ in range(LENGTH.unpack(data)[0] if data else 0):
+            (length,) = LENGTH.unpack(f.read(LENGTH.size))
+            files.append(f.read(length).decode())
+    return digest, rows, files
+
+
+def replay(paint, rows, realtime=False, files=(), timeout=60):
+    """
+    Воспроизведение журнала на редакторе кадр за кадром.
+    Загрузка изображения идет в фоновом потоке, поэтому ее завершение
+    передается в тот же кадр, что и при записи: раньше оно задерживается,
+    а если загрузка не успела, кадр ее ждет.
+
+    Args:
+        paint (Paint): Редактор
+        rows (numpy.ndarray): Записи журнала
+        realtime (bool): Соблюдать исходные интервалы между кадрами
+        files (list): Пути к перетащенным файлам из журнала
+        timeout (float): Наибольшее время ожидания загрузки в секундах
+
+    Returns:
+        list: Длительность кадров в секундах
+
+    Raises:
+        TimeoutError: Загрузка изображения не завершилась вовремя
+    """
+    imports = []  # Завершенные загрузки, ожидающие своего кадра
+    frame_times = []
+    start = time.perf_counter()
+    bounds = np.flatnonzero(np.diff(rows["frame"])) + 1
+    for frame in np.split(rows, bounds):
+        if not len(frame):
+            continue
+        if realtime:
+            delay = start + frame["time"][0] / 1000 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        events = [decode(row, files) for row in frame]
+        # Вместе с записанными обрабатываются события очереди,
+        # например завершение фоновых сохранений
+        queued = take_imports(imports)
+        deadline = time.perf_counter() + timeout
+        for i, event in enumerate(events):
+            if event.type != ImportWorker.IMPORT_DONE:
+                continue
+            while not imports:
+                if time.perf_counter() > deadline:
+                    raise TimeoutError("image import did not finish")
+                time.sleep(0.005)
+                queued += take_imports(imports)
+            events[i] = imports.pop(0)
+        begin = time.perf_counter()
+        paint.handle_events(queued + events)
+        paint.draw()
+        frame_times.append(time.perf_counter() - begin)
+    return frame_times
+
+
+def take_imports(imports):
+    """
+    Получение событий из очереди pygame. Завершения загрузок изображений
+    откладываются до кадров, в которых они произошли при записи.
+
+    Args:
+        imports (list): Отложенные события IMPORT_DONE, дополняется
+
+    Returns:
+        list: Остальные события очереди
+    """
+    events = []
+    for event in pygame.event.get():
+        if event.type == ImportWorker.IMPORT_DONE:
+            imports.append(event)
+        else:
+            events.append(event)
+    return events
+
+
+def main():
+    """
+    Воспроизведение журнала на новом экземпляре редактора и сравнение
+    итогового листа с записанным.
+
+    Returns:
+        int: Код возврата, 1 если лист отличается
+    """
+    from paint import Paint
+    from project import parse_grid
+
+    parser = argparse.ArgumentParser(description="Replay a MyPaint event log")
+    parser.add_argument("log", help="event log recorded with paint.py --record")
+    parser.add_argument(
+        "--realtime", action="store_true", help="keep the recorded timing"
+    )
+    parser.add_argument(
+        "--grid",
+        metavar="WxH",
+        type=parse_grid,
+        default=(80, 55),
+        help="sheet size in cells used for the recording (default 80x55)",
+    )
+    args = parser.parse_args()
+
+    digest, rows, files = load(args.log)
+    paint = Paint(args.grid)
+    start = time.perf_counter()
+    frame_times = replay(paint, rows, args.realtime, files)
+    elapsed = time.perf_counter() - start
+    paint.export_worker.wait()
+
+    times = np.array(frame_times or [0.0]) * 1000
+    p50, p95, p99 = np.percentile(times, (50, 95, 99))
+    print(
+        f"Replayed {len(rows)} events in {len(frame_times)} frames, {elapsed:.2f} s "
+        f"(frame p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms, "
+        f"max {times.max():.2f} ms)"
+    )
+    if canvas_digest(paint.layers) != digest:
+        print("Canvas differs from the recorded session")
+        return 1
+    print("Canvas matches the recorded session")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
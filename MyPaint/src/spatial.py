@@ -0,0 +1,120 @@
+"""
+MyPaint - Пространственный индекс штрихов
+Copyright (c) 2025 Denis Korabelnikov
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+
+class StrokeIndex:
+    """
+    Упорядоченный список штрихов с индексом по равномерной сетке.
+    Каждый штрих регистрируется во всех ячейках сетки, которые пересекает
+    его ограничивающий прямоугольник, поэтому поиск по области
+    просматривает только штрихи поблизости.
+
+    Attributes:
+        bucket (int): Размер ячейки индекса в клетках сетки кисти
+    """
+
+    def __init__(self, bucket=8):
+        self.bucket = bucket
+        self.buckets = defaultdict(set)
+        self.order = {}  # Порядковый номер штриха для сохранения порядка рисования
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        return iter(sorted(self.order, key=self.order.get))
+
+    def keys(self, rect):
+        """
+        Ячейки индекса, которые пересекает прямоугольник.
+
+        Args:
+            rect (pygame.Rect): Прямоугольник в клетках
+
+        Returns:
+            list: Список пар (i, j)
+        """
+        return [
+            (i, j)
+            for i in range(
+                rect.left // self.bucket, (rect.right - 1) // self.bucket + 1
+            )
+            for j in range(
+                rect.top // self.bucket, (rect.bottom - 1) // self.bucket + 1
+            )
+        ]
+
+    def append(self, stroke):
+        """
+        Добавление штриха поверх остальных.
+
+        Args:
+            stroke (Stroke): Штрих
+        """
+        self.order[stroke] = self.counter
+        self.counter += 1
+        for key in self.keys(stroke.rect):
+            self.buckets[key].add(stroke)
+
+    def remove(self, stroke):
+        """
+        Удаление штриха.
+
+        Args:
+            stroke (Stroke): Штрих
+        """
+        del self.order[stroke]
+        for key in self.keys(stroke.rect):
+            self.buckets[key].discard(stroke)
+            if not self.buckets[key]:
+                del self.buckets[key]
+
+    def query(self, rect):
+        """
+        Поиск штрихов, пересекающих прямоугольник.
+
+        Args:
+            rect (pygame.Rect): Прямоугольник в клетках
+
+        Returns:
+            list: Штрихи в порядке рисования
+        """
+        if not rect.width or not rect.height:
+            return []
+        area = (rect.width // self.bucket + 2) * (rect.height // self.bucket + 2)
+        if area > len(self.buckets):
+            # Ячеек в области больше, чем непустых ячеек индекса:
+            # быстрее проверить все штрихи
+            found = self.order
+        else:
+            found = set()
+            for key in self.keys(rect):
+                found.update(self.buckets.get(key, ()))
+        return sorted(
+            (stroke for stroke in found if stroke.rect.colliderect(rect)),
+            key=self.order.get,
+        )
+
+    def query_cells(self, cells):
+        """
+        Поиск штрихов-кандидатов по набору клеток. Просматриваются только
+        ячейки индекса, в которые попали клетки, а не весь охватывающий
+        прямоугольник, что важно для длинных диагональных проходов.
+
+        Args:
+            cells (numpy.ndarray): Клетки формы (N, 2)
+
+        Returns:
+            set: Множество штрихов
+        """
+        found = set()
+        for i, j in np.unique(np.asarray(cells) // self.bucket, axis=0).tolist():
+            found.update(self.buckets.get((i, j), ()))
+        return found